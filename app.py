@@ -1,30 +1,246 @@
 import streamlit as st
 import os
-import tempfile
-from engines.local_engine import process_local
-from engines.cloud_engine import process_cloud
-from utils.visuals import create_spider_chart, create_bar_chart, highlight_text
+import time
+from engines.local_engine import process_local, process_local_stream, rescore_local, warm_up, model_status
+from engines.cloud_engine import process_cloud, process_cloud_stream
+from engines.hybrid_engine import process_auto
+from engines.jobs import JobQueue, WorkerPool, QUEUED, RUNNING, DONE
+from utils.visuals import create_spider_chart, create_bar_chart, create_trend_chart, highlight_text, page_bounds
+from utils.cache import RESULT_CACHE
+from utils.ingest import AudioUpload
+from utils.results_store import SCORE_COLUMNS, get_results_store
+from utils.tracing import prometheus_text
 
 st.set_page_config(page_title="Communication Coach", layout="wide")
 
-def save_uploaded_file(uploaded_file):
+# Load local models in the background so the first request doesn't pay for it.
+# Runs once per process; set COACH_WARM_UP=0 to load lazily on first use only.
+if os.environ.get("COACH_WARM_UP", "1") != "0":
+    warm_up(background=True)
+
+def open_upload(uploaded_file):
+    # A view of the upload's own buffer: no copy and no temp file (see utils/ingest.py)
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            return tmp_file.name
+        return AudioUpload(uploaded_file.getbuffer(), uploaded_file.name)
     except Exception as e:
-        st.error(f"Error saving file: {e}")
+        st.error(f"Error reading file: {e}")
         return None
 
 # Sidebar
 st.sidebar.title("Configuration")
-engine_mode = st.sidebar.radio("Scoring Engine", ["Gemini AI (Cloud)", "Local ML (Offline)"])
+ENGINES = {
+    "Gemini AI (Cloud)": "cloud",
+    "Local ML (Offline)": "local",
+    "Auto (Local, Gemini when unsure)": "auto"
+}
+engine_mode = st.sidebar.radio("Scoring Engine", list(ENGINES))
+engine = ENGINES[engine_mode]
 
 api_key = ""
-if engine_mode == "Gemini AI (Cloud)":
+stream_audio = False
+if engine in ("cloud", "auto"):
     api_key = st.sidebar.text_input("Gemini API Key", type="password")
-    if not api_key:
+    if not api_key and engine == "cloud":
         st.sidebar.warning("Please enter your Gemini API Key.")
+    elif not api_key:
+        st.sidebar.caption("Without a key, Auto scores with the local models only.")
+if engine == "local":
+    stream_audio = st.sidebar.checkbox(
+        "Stream long recordings",
+        help="Transcribe audio segment by segment and show partial results while it runs."
+    )
+elif engine == "cloud":
+    stream_audio = st.sidebar.checkbox(
+        "Stream results",
+        help="Show each category score and its feedback as soon as Gemini has written it."
+    )
+if engine in ("local", "auto"):
+    with st.sidebar.expander("Model status"):
+        for name, info in model_status().items():
+            took = f" ({info['seconds']}s)" if info["seconds"] is not None else ""
+            st.write(f"**{name}**: {info['state']}{took}")
+
+# With COACH_RESULTS_DIR set, every result is saved for the Progress view
+results_store = get_results_store()
+student_id = ""
+if results_store is not None:
+    student_id = st.sidebar.text_input(
+        "Student ID", help="Results are saved under this ID; the Progress view compares them with the cohort."
+    ).strip()
+
+use_workers = st.sidebar.checkbox(
+    "Run in background workers",
+    help="Queue the analysis for a pool of worker processes instead of running it in this page."
+)
+
+@st.cache_resource
+def get_job_queue():
+    # With COACH_WORKERS_EXTERNAL=1 the workers run elsewhere (e.g.
+    # python -m engines.model_host workers) and this process only queues jobs.
+    # Otherwise one pool per Streamlit server process; COACH_WORKERS sets its size
+    if os.environ.get("COACH_WORKERS_EXTERNAL") == "1":
+        return JobQueue()
+    return WorkerPool().start().queue
+
+cache_stats = RESULT_CACHE.stats()
+st.sidebar.caption(
+    f"Result cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+    f"({cache_stats['size']} stored)"
+)
+show_timings = st.sidebar.checkbox("Show debug timings")
+
+def render_result(result):
+    if "error" in result:
+        st.error(result["error"])
+        if result.get("partial_result", {}).get("category_scores"):
+            # Keep what a broken reply did contain
+            st.warning("Showing the part of the result received before the error.")
+            render_result(result["partial_result"])
+        return
+    # Top: Overall Score
+    st.header(f"Overall Score: {result.get('overall_score', 0)}/100")
+    
+    # Spider Chart
+    scores = result.get("category_scores", {})
+    fig_spider = create_spider_chart(scores)
+    st.plotly_chart(fig_spider, use_container_width=True)
+    
+    # Middle: Category Columns
+    cols = st.columns(5)
+    categories = ["Content", "Speech", "Grammar", "Clarity", "Engagement"]
+    for i, cat in enumerate(categories):
+        with cols[i]:
+            st.metric(cat, f"{scores.get(cat, 0)}")
+            if "score_sources" in result:
+                st.caption("via Gemini" if result["score_sources"].get(cat) == "cloud" else "via local models")
+    
+    # Visuals: Bar Chart
+    st.subheader("Score Comparison")
+    fig_bar = create_bar_chart(scores)
+    st.plotly_chart(fig_bar, use_container_width=True)
+    
+    # Transcript with Highlights
+    st.subheader("Transcript Analysis")
+    transcript = result.get("transcript", "")
+    fillers = result.get("fillers_found", [])
+    keywords = result.get("keywords_found", [])
+    
+    if transcript:
+        # Local results carry precomputed offsets; cloud results are matched by term
+        spans = result.get("highlights")
+        n_pages = len(page_bounds(transcript))
+        page = None
+        if n_pages > 1:
+            page = st.number_input(f"Transcript page (of {n_pages})", min_value=1,
+                                   max_value=n_pages, value=1) - 1
+        highlighted_html = highlight_text(transcript, fillers, keywords, spans=spans, page=page)
+        st.markdown(highlighted_html, unsafe_allow_html=True)
+        st.caption("Green: Keywords | Red: Filler Words")
+    
+    # Bottom: Detailed Feedback
+    st.subheader("Detailed Feedback")
+    feedback = result.get("feedback", {})
+    for cat in categories:
+        with st.expander(f"{cat} Feedback"):
+            st.write(feedback.get(cat, "No feedback available."))
+    
+    if show_timings:
+        with st.expander("Debug: timings"):
+            timings = result.get("timings")
+            if timings:
+                st.write(f"Trace {timings['trace_id']}: {timings['total_ms']} ms total")
+                st.json(timings)
+            else:
+                st.write("No timings recorded for this result.")
+            st.code(prometheus_text(), language="text")
+
+def record_result(result, student, engine):
+    if results_store is None or "error" in result:
+        return
+    try:
+        results_store.append(result, student=student, engine=engine)
+    except Exception as e:
+        st.warning(f"Could not save the result: {e}")
+
+def render_progress(student):
+    """
+    The student's weekly average against the cohort's, and where their
+    category averages sit in the cohort's spread.
+    """
+    st.subheader(f"Progress: {student}")
+    mine = results_store.trend("overall_score", student=student, period="week")
+    if not mine["period"]:
+        st.info("No saved results for this student yet.")
+        return
+    cohort = results_store.trend("overall_score", period="week", since=mine["period"][0])
+    st.plotly_chart(create_trend_chart(mine, cohort), use_container_width=True)
+
+    columns = ["overall_score"] + list(SCORE_COLUMNS)
+    spread = results_store.percentiles(columns, q=(0.25, 0.5, 0.75))
+    averages = results_store.cohort_averages(columns, by="student", student=student)
+
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    st.table({
+        "Score": [name.replace("score_", "").replace("_", " ").title() for name in columns],
+        "Student average": [fmt(averages[name][0]) for name in columns],
+        "Cohort 25th pct": [fmt(spread[name][0.25]) for name in columns],
+        "Cohort median": [fmt(spread[name][0.5]) for name in columns],
+        "Cohort 75th pct": [fmt(spread[name][0.75]) for name in columns],
+    })
+    st.caption(f"{averages['sessions'][0]} sessions saved for this student.")
+
+def run_local_stream(audio_path):
+    """
+    Runs the streaming local engine, updating progress placeholders as
+    segments are transcribed. Returns the final result.
+    """
+    status = st.empty()
+    partial_score = st.empty()
+    partial_transcript = st.empty()
+    result = {}
+    for event in process_local_stream(audio_path):
+        if event["type"] == "partial":
+            segment = event["segment"]
+            minutes, seconds = divmod(int(segment["audio_seconds"]), 60)
+            status.info(f"Transcribed {minutes}:{seconds:02d} of audio ({segment['index'] + 1} segments)...")
+            if event["result"]:
+                partial_score.metric("Provisional Score (grammar pending)", event["result"]["overall_score"])
+            partial_transcript.caption(segment["transcript"])
+        else:
+            result = event["result"]
+    status.empty()
+    partial_score.empty()
+    partial_transcript.empty()
+    return result
+
+def run_cloud_stream(audio, text_input):
+    """
+    Runs the streaming cloud engine, showing scores and feedback as they
+    arrive. Returns the final result.
+    """
+    status = st.empty()
+    status.info("Waiting for Gemini...")
+    cols = st.columns(5)
+    categories = ["Content", "Speech", "Grammar", "Clarity", "Engagement"]
+    slots = {label: col.empty() for label, col in zip(categories, cols)}
+    feedback = st.empty()
+    result = {}
+    for event in process_cloud_stream(audio, text_input, api_key):
+        if event["type"] == "partial":
+            partial = event["result"]
+            status.info("Receiving scores...")
+            for label, score in partial["category_scores"].items():
+                slots[label].metric(label, score)
+            feedback.markdown("\n".join(f"- **{k}**: {v}" for k, v in partial["feedback"].items()))
+        else:
+            result = event["result"]
+    status.empty()
+    for slot in slots.values():
+        slot.empty()
+    feedback.empty()
+    return result
 
 st.title("🗣️ Communication Coach")
 st.markdown("Upload your self-introduction audio or paste text to get a rubric-based score.")
@@ -41,61 +257,64 @@ if st.button("Analyze"):
         st.error("Please provide audio or text input.")
     else:
         with st.spinner(f"Analyzing using {engine_mode}..."):
-            # Save audio if present
-            audio_path = None
-            if uploaded_file:
-                audio_path = save_uploaded_file(uploaded_file)
-            
-            # Process
-            result = {}
-            if engine_mode == "Gemini AI (Cloud)":
-                result = process_cloud(audio_path, text_input, api_key)
-            else:
-                result = process_local(audio_path, text_input)
-            
-            # Cleanup temp file
-            if audio_path and os.path.exists(audio_path):
-                os.remove(audio_path)
-                
-            # Display Results
-            if "error" in result:
-                st.error(result["error"])
-            else:
-                # Top: Overall Score
-                st.header(f"Overall Score: {result.get('overall_score', 0)}/100")
-                
-                # Spider Chart
-                scores = result.get("category_scores", {})
-                fig_spider = create_spider_chart(scores)
-                st.plotly_chart(fig_spider, use_container_width=True)
-                
-                # Middle: Category Columns
-                cols = st.columns(5)
-                categories = ["Content", "Speech", "Grammar", "Clarity", "Engagement"]
-                for i, cat in enumerate(categories):
-                    with cols[i]:
-                        st.metric(cat, f"{scores.get(cat, 0)}")
-                
-                # Visuals: Bar Chart
-                st.subheader("Score Comparison")
-                fig_bar = create_bar_chart(scores)
-                st.plotly_chart(fig_bar, use_container_width=True)
-                
-                # Transcript with Highlights
-                st.subheader("Transcript Analysis")
-                transcript = result.get("transcript", "")
-                fillers = result.get("fillers_found", [])
-                keywords = result.get("keywords_found", [])
-                
-                if transcript:
-                    highlighted_html = highlight_text(transcript, fillers, keywords)
-                    st.markdown(highlighted_html, unsafe_allow_html=True)
-                    st.caption("Green: Keywords | Red: Filler Words")
-                
-                # Bottom: Detailed Feedback
-                st.subheader("Detailed Feedback")
-                feedback = result.get("feedback", {})
-                for cat in categories:
-                    with st.expander(f"{cat} Feedback"):
-                        st.write(feedback.get(cat, "No feedback available."))
+            audio = open_upload(uploaded_file) if uploaded_file else None
+            try:
+                # Process
+                result = {}
+                if use_workers:
+                    # Workers are other processes, so they get a file; the worker
+                    # deletes it once the job is done
+                    st.session_state["job_id"] = get_job_queue().submit(
+                        engine, audio.save() if audio else None, text_input, api_key or None, cleanup_audio=True
+                    )
+                    st.session_state["job_owner"] = (student_id, engine)
+                    st.session_state.pop("result", None)
+                    st.rerun()
+                if engine == "cloud" and stream_audio:
+                    result = run_cloud_stream(audio, text_input)
+                elif engine == "cloud":
+                    result = process_cloud(audio, text_input, api_key)
+                elif engine == "auto":
+                    result = process_auto(audio, text_input, api_key or None)
+                elif audio and stream_audio:
+                    result = run_local_stream(audio)
+                elif audio:
+                    result = process_local(audio, text_input)
+                else:
+                    # Re-analyzing an edited transcript only redoes the changed sentences
+                    result = rescore_local(text_input, previous=st.session_state.get("result"))
+            finally:
+                # Drops the view of the upload and any spilled file, even on errors
+                if audio is not None:
+                    audio.close()
+
+            # Keep the result across reruns (e.g. when paging the transcript)
+            st.session_state["result"] = result
+            record_result(result, student_id, engine)
+
+# Poll a background job until it finishes
+if "job_id" in st.session_state:
+    queue = get_job_queue()
+    job = queue.get(st.session_state["job_id"])
+    if job is None:
+        del st.session_state["job_id"]
+    elif job["status"] in (QUEUED, RUNNING):
+        st.info(f"Job {job['status']} (attempt {max(job['attempts'], 1)} of {job['max_attempts']})...")
+        time.sleep(1)
+        st.rerun()
+    elif job["status"] == DONE:
+        st.session_state["result"] = job["result"]
+        record_result(job["result"], *st.session_state.pop("job_owner", (student_id, engine)))
+        del st.session_state["job_id"]
+    else:
+        st.error(f"Job failed: {job['error']}")
+        if st.button("Retry job"):
+            queue.retry(job["id"])
+            st.rerun()
+
+# Display Results
+if "result" in st.session_state:
+    render_result(st.session_state["result"])
 
+if results_store is not None and student_id:
+    render_progress(student_id)
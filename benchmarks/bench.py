@@ -0,0 +1,343 @@
+"""
+Per-stage latency/throughput/memory benchmark for the scoring pipeline.
+
+    python -m benchmarks.bench --out report.json
+    python -m benchmarks.bench --baseline benchmarks/baseline.json --max-regression 0.25
+    python -m benchmarks.bench --save-baseline benchmarks/baseline.json
+
+Runs synthetic transcripts (and synthetic audio unless --no-audio) through
+each stage of the local engine, plus process_local end to end and
+process_cloud against the local Gemini stub. embed_concurrent sends small
+embedding requests from --concurrency threads and reports aggregate
+throughput with and without the EmbeddingBatcher. Stages whose model is not
+installed are reported as skipped. With --baseline, exits non-zero when a
+stage's p50 or p95 is slower than the baseline by more than --max-regression.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import make_audio, make_transcript
+from engines import local_engine
+from engines.cloud_engine import process_cloud
+from utils.cache import RESULT_CACHE, SENTENCE_MEMO
+from utils.gemini_stub import start_stub_server
+from utils.lexical import analyze
+
+STAGES = ["decode", "transcribe", "lexical", "embed", "embed_concurrent", "keyword_match", "grammar",
+          "sentiment", "scoring", "local_end_to_end", "cloud_end_to_end"]
+
+# Sentences per request in the concurrent embedding run, like a session
+# re-embedding the few sentences it edited
+CONCURRENT_REQUEST_SENTENCES = 4
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is the process high-water mark (KiB on Linux, bytes on macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+
+class RssSampler:
+    """
+    Samples resident memory on a thread while a stage runs and keeps the peak.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+        self.peaks = {}
+        self.skipped = {}
+
+    def run(self, stage, fn, *args):
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            out = fn(*args)
+            elapsed = time.perf_counter() - start
+        self.samples.setdefault(stage, []).append(elapsed)
+        self.peaks[stage] = max(self.peaks.get(stage, 0.0), rss.peak)
+        return out
+
+    def record(self, stage, elapsed):
+        # For samples timed elsewhere (e.g. on worker threads)
+        self.samples.setdefault(stage, []).append(elapsed)
+        self.peaks[stage] = max(self.peaks.get(stage, 0.0), current_rss_mb())
+
+    def skip(self, stage, reason):
+        self.skipped.setdefault(stage, reason)
+
+    def report(self):
+        stages = {}
+        for stage in STAGES:
+            times = self.samples.get(stage)
+            if not times:
+                if stage in self.skipped:
+                    stages[stage] = {"skipped": self.skipped[stage]}
+                continue
+            total = sum(times)
+            stages[stage] = {
+                "n": len(times),
+                "p50_ms": round(percentile(times, 50) * 1000, 3),
+                "p95_ms": round(percentile(times, 95) * 1000, 3),
+                "mean_ms": round(statistics.mean(times) * 1000, 3),
+                "throughput_per_s": round(len(times) / total, 2) if total else None,
+                "peak_rss_mb": round(self.peaks[stage], 1)
+            }
+        return stages
+
+
+def bench_text(timer, transcript, duration_minutes):
+    features = timer.run("lexical", analyze, transcript)
+
+    st_model = local_engine.get_st_model()
+    keyword_index = local_engine.get_keyword_index()
+    if st_model is not None and keyword_index is not None:
+        sentences = local_engine.split_sentences(transcript)
+        embeddings = timer.run("embed", lambda s: st_model.encode(s, convert_to_tensor=True), sentences)
+        matches = timer.run("keyword_match", local_engine.match_keywords, keyword_index, embeddings)[0]
+    else:
+        timer.skip("embed", "sentence-transformers unavailable")
+        matches = timer.run("keyword_match", local_engine.fallback_keywords, features)
+
+    tool = local_engine.get_grammar_tool()
+    if tool is not None:
+        errors = timer.run("grammar", local_engine.check_grammar, tool, transcript)
+    else:
+        timer.skip("grammar", "LanguageTool unavailable")
+        errors = None
+
+    analyzer = local_engine.get_analyzer()
+    if analyzer is None:
+        for stage in ("sentiment", "scoring", "local_end_to_end"):
+            timer.skip(stage, "vaderSentiment unavailable")
+        return
+    sentiment = timer.run("sentiment", analyzer.polarity_scores, transcript)
+    timer.run("scoring", local_engine.score_transcript,
+              transcript, duration_minutes, matches, errors, sentiment, features)
+
+    # Cold path: no cached result and no memoized sentences
+    RESULT_CACHE.clear()
+    SENTENCE_MEMO.clear()
+    timer.run("local_end_to_end", local_engine.process_local, None, transcript)
+
+
+def bench_embed_concurrency(timer, transcripts, threads):
+    """
+    Embeds small requests from `threads` threads at once, first straight on
+    the model and then through the EmbeddingBatcher. Returns aggregate
+    sentences/second for both; the batched requests' latencies are the
+    embed_concurrent stage.
+    """
+    st_model = local_engine.get_st_model()
+    embedder = local_engine.get_embedder()
+    if embedder is None:
+        timer.skip("embed_concurrent", "sentence-transformers unavailable")
+        return None
+    requests = []
+    for transcript in transcripts:
+        sentences = local_engine.split_sentences(transcript)
+        for i in range(0, len(sentences), CONCURRENT_REQUEST_SENTENCES):
+            requests.append(sentences[i:i + CONCURRENT_REQUEST_SENTENCES])
+    n_sentences = sum(len(r) for r in requests)
+
+    def throughput(encode, stage=None):
+        def one(sentences):
+            start = time.perf_counter()
+            encode(sentences)
+            if stage:
+                timer.record(stage, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(one, requests))
+        return round(n_sentences / (time.perf_counter() - start), 1)
+
+    direct = throughput(lambda s: st_model.encode(s, convert_to_numpy=True))
+    batched = throughput(embedder.encode, "embed_concurrent")
+    return {
+        "threads": threads,
+        "requests": len(requests),
+        "direct_sentences_per_s": direct,
+        "batched_sentences_per_s": batched,
+        "batcher": embedder.stats()
+    }
+
+
+def bench_audio(timer, path):
+    audio = timer.run("decode", local_engine.ingest_audio, path)
+    whisper_model = local_engine.get_whisper()
+    if whisper_model is None:
+        timer.skip("transcribe", "Whisper unavailable")
+        return
+    timer.run("transcribe", whisper_model.transcribe, audio["samples"])
+
+
+def bench_cloud(timer, transcripts):
+    server, base_url = start_stub_server()
+    try:
+        for transcript in transcripts:
+            RESULT_CACHE.clear()
+            timer.run("cloud_end_to_end", process_cloud, None, transcript, "bench-key", base_url)
+    finally:
+        server.shutdown()
+
+
+def run(sizes, audio_seconds, repeats, stages=None, concurrency=8):
+    timer = StageTimer()
+    transcripts = [make_transcript(n, seed=r) for n in sizes for r in range(repeats)]
+    wanted = set(stages or STAGES)
+
+    # Load models up front so load time is not counted as stage latency
+    local_engine.warm_up(background=False)
+
+    if wanted & {"lexical", "embed", "keyword_match", "grammar", "sentiment", "scoring", "local_end_to_end"}:
+        for transcript in transcripts:
+            try:
+                bench_text(timer, transcript, len(transcript.split()) / 130)
+            except Exception as e:
+                timer.skip("local_end_to_end", f"{type(e).__name__}: {e}")
+                break
+
+    embed_concurrency = None
+    if "embed_concurrent" in wanted:
+        embed_concurrency = bench_embed_concurrency(timer, transcripts, concurrency)
+
+    if wanted & {"decode", "transcribe"}:
+        with tempfile.TemporaryDirectory() as tmp:
+            for seconds in audio_seconds:
+                for r in range(repeats):
+                    path = make_audio(os.path.join(tmp, f"bench-{seconds}-{r}.wav"), seconds, seed=r)
+                    try:
+                        bench_audio(timer, path)
+                    except Exception as e:
+                        timer.skip("decode", f"{type(e).__name__}: {e}")
+                        break
+
+    if "cloud_end_to_end" in wanted:
+        bench_cloud(timer, transcripts)
+
+    report = timer.report()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "audio_seconds": audio_seconds,
+            "repeats": repeats,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "stages": {k: v for k, v in report.items() if k in wanted},
+        "embed_concurrency": embed_concurrency
+    }
+
+
+def compare(report, baseline, max_regression):
+    """
+    Returns a list of human-readable regressions against a baseline report.
+    """
+    regressions = []
+    for stage, current in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or "skipped" in current or "skipped" in base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if base[metric] and current[metric] > base[metric] * (1 + max_regression):
+                regressions.append(
+                    f"{stage} {metric}: {current[metric]:.2f} vs baseline {base[metric]:.2f} "
+                    f"(+{(current[metric] / base[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scoring pipeline stage by stage.")
+    parser.add_argument("--sizes", default="50,200,1000", help="Transcript word counts")
+    parser.add_argument("--audio-seconds", default="10,60", help="Synthetic audio lengths")
+    parser.add_argument("--no-audio", action="store_true", help="Skip decode/transcribe stages")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--stages", help=f"Comma-separated subset of: {','.join(STAGES)}")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Threads in the concurrent embedding run")
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Baseline report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed slowdown vs baseline as a fraction (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", help="Also write the report as a new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x]
+    audio_seconds = [] if args.no_audio else [float(x) for x in args.audio_seconds.split(",") if x]
+    stages = args.stages.split(",") if args.stages else None
+    if args.no_audio:
+        stages = [s for s in (stages or STAGES) if s not in ("decode", "transcribe")]
+
+    report = run(sizes, audio_seconds, args.repeats, stages, args.concurrency)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Accuracy and speed of an inference backend against the default one.
+
+    python -m benchmarks.compare_backends --candidate whisper=ctranslate2,embed=onnx-int8
+    python -m benchmarks.compare_backends recordings/ --candidate whisper=ctranslate2,size=small
+
+Scores the same inputs (synthetic transcripts, or a directory/manifest as
+accepted by cli.py) once per configuration, each in a fresh process so the
+environment-selected backends load cleanly, with the result cache off.
+Reports score differences per category, transcript word error rate between
+the two Whisper backends, and the transcribe/embed time of each. Exits
+non-zero when the candidate drifts past --max-score-diff or --max-wer.
+
+A configuration is a comma-separated list of whisper=<backend>,
+size=<tiny|base|small>, compute=<ctranslate2 compute type> and
+embed=<backend>; see engines/inference.py.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+
+from benchmarks.corpus import make_transcript
+
+CONFIG_ENV = {
+    "whisper": "COACH_WHISPER_BACKEND",
+    "size": "COACH_WHISPER_MODEL",
+    "compute": "COACH_WHISPER_COMPUTE",
+    "embed": "COACH_EMBED_BACKEND",
+}
+CATEGORIES = ["Content", "Speech", "Grammar", "Clarity", "Engagement"]
+
+
+def parse_config(spec):
+    config = {}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, value = part.partition("=")
+        if name not in CONFIG_ENV or not value:
+            raise ValueError(f"Bad backend option {part!r}; expected one of {', '.join(CONFIG_ENV)}=<value>")
+        config[name] = value
+    return config
+
+
+def _score_all(config, records):
+    # Runs in a spawned process: the backends are read from the environment at import
+    for name, value in config.items():
+        os.environ[CONFIG_ENV[name]] = value
+    os.environ["COACH_RESULT_CACHE_SIZE"] = "0"
+    os.environ["COACH_RESULT_CACHE_DB"] = ""
+    from engines import local_engine
+
+    local_engine.warm_up(background=False)
+    out = []
+    for record in records:
+        result = local_engine.process_local_batch([(record["audio_path"], record["text_input"])])[0]
+        out.append(result)
+    return {"model_id": local_engine.LOCAL_MODEL_ID, "results": out}
+
+
+def score_with(config, records):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_score_all, (config, records))
+
+
+def word_error_rate(reference, hypothesis):
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+def _stage_ms(results, stage):
+    return round(sum(r.get("timings", {}).get("stages_ms", {}).get(stage, 0.0) for r in results), 1)
+
+
+def compare(baseline, candidate, records):
+    """
+    Summarizes per-record differences between two score_with() outputs.
+    """
+    diffs = {cat: [] for cat in CATEGORIES + ["Overall"]}
+    wers = []
+    errors = 0
+    for record, base, cand in zip(records, baseline["results"], candidate["results"]):
+        if "error" in base or "error" in cand:
+            errors += 1
+            continue
+        for cat in CATEGORIES:
+            diffs[cat].append(abs(cand["category_scores"].get(cat, 0) - base["category_scores"].get(cat, 0)))
+        diffs["Overall"].append(abs(cand["overall_score"] - base["overall_score"]))
+        if record["audio_path"]:
+            wers.append(word_error_rate(base["transcript"], cand["transcript"]))
+    return {
+        "baseline": baseline["model_id"],
+        "candidate": candidate["model_id"],
+        "records": len(records),
+        "errors": errors,
+        "score_diff": {
+            cat: {"mean": round(statistics.mean(v), 2), "max": max(v)} if v else None
+            for cat, v in diffs.items()
+        },
+        "wer": {"mean": round(statistics.mean(wers), 4), "max": round(max(wers), 4)} if wers else None,
+        "ms": {
+            name: {stage: _stage_ms(run["results"], stage) for stage in ("transcribe", "embed")}
+            for name, run in (("baseline", baseline), ("candidate", candidate))
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare an inference backend against the default.")
+    parser.add_argument("input", nargs="?", help="Directory of audio or a .jsonl/.csv manifest "
+                                                 "(default: synthetic transcripts)")
+    parser.add_argument("--baseline", default="", help="Baseline configuration (default: the defaults)")
+    parser.add_argument("--candidate", required=True, help="Candidate configuration")
+    parser.add_argument("--limit", type=int, default=50, help="Records to score")
+    parser.add_argument("--max-score-diff", type=float, default=2.0,
+                        help="Allowed mean absolute difference in overall score")
+    parser.add_argument("--max-wer", type=float, default=0.1,
+                        help="Allowed mean word error rate against the baseline transcripts")
+    parser.add_argument("--out", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline_config = parse_config(args.baseline)
+        candidate_config = parse_config(args.candidate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.input:
+        from engines.bulk import iter_records
+        records = []
+        for record in iter_records(args.input):
+            records.append(record)
+            if len(records) >= args.limit:
+                break
+    else:
+        records = [
+            {"id": str(n), "audio_path": None, "text_input": make_transcript(100 + 20 * n, seed=n)}
+            for n in range(args.limit)
+        ]
+
+    report = compare(score_with(baseline_config, records), score_with(candidate_config, records), records)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    failures = []
+    overall = report["score_diff"]["Overall"]
+    if overall and overall["mean"] > args.max_score_diff:
+        failures.append(f"mean overall score difference {overall['mean']} > {args.max_score_diff}")
+    if report["wer"] and report["wer"]["mean"] > args.max_wer:
+        failures.append(f"mean WER {report['wer']['mean']} > {args.max_wer}")
+    if report["errors"]:
+        failures.append(f"{report['errors']} records failed to score")
+    for line in failures:
+        print(f"OUT OF TOLERANCE {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Synthetic benchmark inputs: self-introduction style transcripts of a given
+word count, and WAV files of tone bursts separated by silence.
+Everything is generated locally and seeded, so runs are comparable.
+"""
+import os
+import random
+import wave
+
+import numpy as np
+
+from utils.audio import SAMPLE_RATE
+from utils.rubric import RUBRIC
+
+_OPENINGS = ["Hello everyone.", "Good morning.", "Hi.", ""]
+_TEMPLATES = [
+    "My name is {name}.",
+    "I am {age} years old.",
+    "I study in class {grade} at {school} school.",
+    "My family has {n} members and we live near the {place}.",
+    "My hobbies are {hobby} and {hobby2}.",
+    "My ambition is to become a {job}.",
+    "A fun fact about me is that I can {skill}.",
+    "One of my strengths is that I am {trait}.",
+    "I really enjoy {hobby} with my friends on weekends.",
+    "Thank you for listening.",
+]
+_FILLS = {
+    "name": ["Asha", "Rohan", "Mia", "Leo", "Sam", "Priya"],
+    "age": ["12", "13", "14", "15", "16"],
+    "grade": ["seven", "eight", "nine", "ten"],
+    "school": ["Lincoln High", "Green Valley", "Riverside", "St. Mary's"],
+    "n": ["three", "four", "five"],
+    "place": ["park", "river", "market", "station"],
+    "hobby": ["reading", "painting", "football", "coding", "singing"],
+    "hobby2": ["chess", "swimming", "cooking", "drawing"],
+    "job": ["doctor", "engineer", "teacher", "pilot"],
+    "skill": ["juggle", "solve a puzzle cube", "whistle loudly"],
+    "trait": ["patient", "curious", "hardworking", "friendly"],
+}
+
+
+def make_transcript(n_words, seed=0, filler_rate=0.04):
+    """
+    A transcript of about n_words words built from rubric-relevant sentences,
+    with fillers mixed in at filler_rate.
+    """
+    rng = random.Random(seed)
+    fillers = RUBRIC["clarity"]["fillers"]
+    words = rng.choice(_OPENINGS).split()
+    while len(words) < n_words:
+        sentence = rng.choice(_TEMPLATES).format(**{k: rng.choice(v) for k, v in _FILLS.items()})
+        for word in sentence.split():
+            if rng.random() < filler_rate:
+                words.append(rng.choice(fillers) + ",")
+            words.append(word)
+    return " ".join(words[:n_words]).rstrip(",") + "."
+
+
+def make_audio(path, seconds, seed=0, speech_ratio=0.75):
+    """
+    Writes a 16 kHz mono WAV of `seconds` made of tone bursts (voiced) and
+    silences, with roughly speech_ratio of the time voiced.
+    """
+    rng = random.Random(seed)
+    total = int(seconds * SAMPLE_RATE)
+    chunks = []
+    filled = 0
+    voiced = True
+    while filled < total:
+        upper = 3.0 if voiced else 3.0 * (1 - speech_ratio) / speech_ratio
+        length = min(int(rng.uniform(0.8, max(upper, 0.9)) * SAMPLE_RATE), total - filled)
+        if voiced:
+            t = np.arange(length) / SAMPLE_RATE
+            chunks.append(0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t))
+        else:
+            chunks.append(np.zeros(length))
+        filled += length
+        voiced = not voiced
+    pcm = (np.concatenate(chunks) * 32767).astype("<i2")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return path
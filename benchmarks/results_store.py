@@ -0,0 +1,106 @@
+"""
+Dashboard query latency of the results store (utils/results_store.py).
+
+    python -m benchmarks.results_store --sessions 100000 --students 500
+    python -m benchmarks.results_store --sessions 100000 --max-query-seconds 0.5
+
+Fills a fresh store in a temporary directory with synthetic sessions spread
+over --days days, then times the Progress view's queries (and a few cohort
+queries) over --repeats runs. Exits non-zero when any query's p95 is slower
+than --max-query-seconds. Requires pyarrow.
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from utils.results_store import SCORE_COLUMNS, ResultsStore
+from utils.rubric import DEFAULT_PLAN, RUBRIC_VERSION
+
+
+def synthetic_result(rng):
+    scores = {label: round(rng.uniform(0.3, 1.0) * m, 2) for label, m in DEFAULT_PLAN.max_scores.items()}
+    word_count = rng.randint(60, 400)
+    return {
+        "overall_score": round(sum(scores.values()), 2),
+        "category_scores": scores,
+        "metrics": {"wpm": rng.uniform(80, 180), "errors_per_100": rng.uniform(0, 8), "ttr": rng.uniform(0.3, 0.9),
+                    "filler_pct": rng.uniform(0, 10), "positivity": rng.uniform(0, 0.5), "word_count": word_count},
+        "timings": {"total_ms": rng.uniform(500, 5000), "stages_ms": {"transcribe": rng.uniform(400, 4000)}}
+    }
+
+
+def fill(store, sessions, students, days, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    step = datetime.timedelta(days=days) / sessions
+    batch = []
+    for n in range(sessions):
+        batch.append(dict(result=synthetic_result(rng), student=f"student-{rng.randrange(students)}",
+                          engine=rng.choice(("local", "cloud")), rubric_version=RUBRIC_VERSION,
+                          recorded_at=start + n * step))
+        if len(batch) == 10000:
+            store.append_many(batch)
+            batch = []
+    store.append_many(batch)
+    store.flush()
+
+
+def queries(student):
+    columns = ["overall_score"] + list(SCORE_COLUMNS)
+    return {
+        "student_trend": lambda s: s.trend("overall_score", student=student, period="week"),
+        "cohort_trend": lambda s: s.trend("overall_score", period="week"),
+        "cohort_percentiles": lambda s: s.percentiles(columns, q=(0.25, 0.5, 0.75)),
+        "student_averages": lambda s: s.cohort_averages(columns, by="student", student=student),
+        "cohort_averages": lambda s: s.cohort_averages(columns + ["wpm", "filler_count"], by="student"),
+        "rubric_percentiles": lambda s: s.percentiles("wpm", rubric_version=RUBRIC_VERSION),
+    }
+
+
+def run(sessions, students, days, repeats):
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultsStore(root)
+        started = time.perf_counter()
+        fill(store, sessions, students, days)
+        report = {"sessions": sessions, "students": students, "days": days,
+                  "ingest_s": round(time.perf_counter() - started, 2), "queries": {}}
+        for name, query in queries("student-1").items():
+            times = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                query(store)
+                times.append(time.perf_counter() - started)
+            report["queries"][name] = {
+                "p50_s": round(statistics.median(times), 4),
+                "p95_s": round(statistics.quantiles(times, n=20, method="inclusive")[-1], 4)
+            }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark results store dashboard queries.")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-query-seconds", type=float, help="Fail when a query's p95 is slower than this")
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.students, args.days, max(args.repeats, 2))
+    print(json.dumps(report, indent=2))
+    if args.max_query_seconds is not None:
+        slow = [name for name, q in report["queries"].items() if q["p95_s"] > args.max_query_seconds]
+        for name in slow:
+            print(f"SLOW {name}: p95 {report['queries'][name]['p95_s']}s > {args.max_query_seconds}s", file=sys.stderr)
+        if slow:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
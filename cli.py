@@ -0,0 +1,50 @@
+"""
+Headless bulk scoring.
+
+    python cli.py archive/audio/ results.jsonl --workers 4
+    python cli.py transcripts.jsonl results.parquet --batch-size 64
+    python cli.py manifest.csv results.jsonl --engine cloud --api-key $GEMINI_API_KEY
+
+Re-running the same command resumes: records already scored are skipped and
+records that failed are retried.
+"""
+import argparse
+import os
+import sys
+import time
+
+from engines.bulk import run_bulk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a directory of recordings or a transcript manifest.")
+    parser.add_argument("input", help="Directory of audio files, or a .jsonl/.csv manifest")
+    parser.add_argument("output", help="Results file (.jsonl), or a .parquet directory")
+    parser.add_argument("--engine", choices=["local", "cloud"], default="local")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"),
+                        help="Gemini API key for --engine cloud (default: $GEMINI_API_KEY)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes (0 = score in this process)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    if args.engine == "cloud" and not args.api_key:
+        parser.error("--engine cloud needs --api-key or GEMINI_API_KEY")
+
+    start = time.perf_counter()
+
+    def progress(stats):
+        if stats["scored"] % 50 == 0:
+            rate = stats["scored"] / (time.perf_counter() - start)
+            print(f"{stats['scored']} scored ({rate:.1f}/s), {stats['errors']} errors", file=sys.stderr)
+
+    stats = run_bulk(args.input, args.output, engine=args.engine, api_key=args.api_key,
+                     workers=args.workers, batch_size=args.batch_size, progress=progress)
+    elapsed = time.perf_counter() - start
+    print(f"Done in {elapsed:.1f}s: {stats['scored']} scored, {stats['skipped']} already done, "
+          f"{stats['errors']} errors.")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
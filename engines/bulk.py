@@ -0,0 +1,241 @@
+"""
+Offline bulk scoring of audio directories and transcript manifests.
+
+Records stream through the same engines the app uses, in batches, on a pool
+of worker processes; results are appended to the output as they finish so an
+interrupted run resumes where it stopped. Records whose result was an error
+are scored again on resume; the output keeps the error row as well, so the
+last row for an id is the current one. Nothing here imports Streamlit.
+"""
+import csv
+import glob
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from engines.inference import set_threads, threads_per_worker
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".ogg", ".flac")
+CATEGORIES = ["Content", "Speech", "Grammar", "Clarity", "Engagement"]
+
+
+def iter_records(input_path):
+    """
+    Yields {"id", "audio_path", "text_input"} records from a directory of audio
+    files (searched recursively), a JSONL manifest or a CSV manifest.
+    Manifest rows use "id" plus "audio_path" and/or "text" (or "transcript");
+    relative audio paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(input_path):
+        for path in sorted(glob.glob(os.path.join(input_path, "**", "*"), recursive=True)):
+            if path.lower().endswith(AUDIO_EXTENSIONS):
+                yield {"id": os.path.relpath(path, input_path), "audio_path": path, "text_input": None}
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    with open(input_path, newline="", encoding="utf-8") as f:
+        if input_path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for n, row in enumerate(rows):
+            audio_path = row.get("audio_path") or None
+            if audio_path and not os.path.isabs(audio_path):
+                audio_path = os.path.join(base_dir, audio_path)
+            yield {
+                "id": str(row.get("id") or n),
+                "audio_path": audio_path,
+                "text_input": row.get("text") or row.get("transcript") or None
+            }
+
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def score_batch(batch, engine="local", api_key=None):
+    """
+    Scores one batch in this process; returns [(record_id, result)].
+    """
+    if engine == "cloud":
+        from engines.cloud_engine import process_cloud_batch
+        results = process_cloud_batch([(r["audio_path"], r["text_input"]) for r in batch], api_key)
+    else:
+        from engines.local_engine import process_local_batch
+        results = process_local_batch([(r["audio_path"], r["text_input"]) for r in batch])
+    return [(r["id"], result) for r, result in zip(batch, results)]
+
+
+def _safe_score_batch(batch, engine, api_key):
+    try:
+        return score_batch(batch, engine, api_key)
+    except Exception as e:
+        if len(batch) == 1:
+            return [(batch[0]["id"], {"error": f"{type(e).__name__}: {e}"})]
+    # One record broke the batch; score the rest on their own
+    return [pair for r in batch for pair in _safe_score_batch([r], engine, api_key)]
+
+
+def score_records(records, engine="local", api_key=None, workers=0, batch_size=16):
+    """
+    Yields (record_id, result) as batches complete. workers=0 scores in this
+    process; otherwise batches run on that many worker processes, each with
+    its own models, with at most 2 * workers batches in flight.
+    """
+    batches = _batches(records, batch_size)
+    if workers <= 0:
+        for batch in batches:
+            yield from _safe_score_batch(batch, engine, api_key)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=set_threads,
+                             initargs=(threads_per_worker(workers),)) as pool:
+        in_flight = set()
+        for batch in batches:
+            in_flight.add(pool.submit(_safe_score_batch, batch, engine, api_key))
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in in_flight:
+            yield from future.result()
+
+
+def parquet_schema():
+    # One schema for every part, so the parts read back as a single table
+    import pyarrow as pa
+    return pa.schema(
+        [("id", pa.string()), ("error", pa.string()), ("overall_score", pa.float64())]
+        + [(cat.lower(), pa.float64()) for cat in CATEGORIES]
+        + [("result_json", pa.string())]
+    )
+
+
+def flatten_result(record_id, result):
+    """
+    One flat row per result for columnar output; the full result is kept as JSON.
+    """
+    scores = result.get("category_scores", {})
+    row = {
+        "id": record_id,
+        "error": result.get("error"),
+        "overall_score": result.get("overall_score"),
+    }
+    for cat in CATEGORIES:
+        row[cat.lower()] = scores.get(cat)
+    row["result_json"] = json.dumps(result)
+    return row
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.path = path
+
+    def done_ids(self):
+        ids = set()
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        if row.get("error") is None:
+                            ids.add(row["id"])
+                    except (ValueError, KeyError):
+                        continue  # a line cut short by an interrupted run
+        return ids
+
+    def __enter__(self):
+        self._f = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def write(self, record_id, result):
+        self._f.write(json.dumps({"id": record_id, **result}) + "\n")
+        self._f.flush()
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+class ParquetWriter:
+    """
+    Writes to a directory of Parquet part files, one per flush, so a run can
+    be resumed without rewriting earlier parts. Requires pyarrow.
+    """
+
+    def __init__(self, path, flush_rows=500):
+        import pyarrow  # noqa: F401 - fail early if unavailable
+        self.path = path
+        self.flush_rows = flush_rows
+        self._rows = []
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def done_ids(self):
+        import pyarrow.parquet as pq
+        ids = set()
+        for part in self._parts():
+            table = pq.read_table(part, columns=["id", "error"])
+            ids.update(i for i, error in zip(table.column("id").to_pylist(), table.column("error").to_pylist())
+                       if error is None)
+        return ids
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def write(self, record_id, result):
+        self._rows.append(flatten_result(record_id, result))
+        if len(self._rows) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        part = os.path.join(self.path, f"part-{len(self._parts()):05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._rows, schema=parquet_schema()), part + ".tmp")
+        os.replace(part + ".tmp", part)
+        self._rows = []
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def run_bulk(input_path, output_path, engine="local", api_key=None, workers=0,
+             batch_size=16, progress=None):
+    """
+    Scores every record of input_path not already in output_path and appends
+    the results. Output is JSONL, or Parquet parts when output_path ends with
+    .parquet. Returns {"scored", "skipped", "errors"}.
+    """
+    writer = ParquetWriter(output_path) if output_path.endswith(".parquet") else JsonlWriter(output_path)
+    done = writer.done_ids()
+    stats = {"scored": 0, "skipped": 0, "errors": 0}
+
+    def pending():
+        for record in iter_records(input_path):
+            if record["id"] in done:
+                stats["skipped"] += 1
+                continue
+            yield record
+
+    with writer:
+        for record_id, result in score_records(pending(), engine, api_key, workers, batch_size):
+            writer.write(record_id, result)
+            stats["scored"] += 1
+            if "error" in result:
+                stats["errors"] += 1
+            if progress:
+                progress(stats)
+    return stats
@@ -1,29 +1,72 @@
-import google.generativeai as genai
+import asyncio
+import http.client
 import json
+import mimetypes
 import os
-from utils.rubric import RUBRIC
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from functools import lru_cache
+from utils.rubric import DEFAULT_PLAN, RUBRIC, as_score
+from utils.cache import RESULT_CACHE, result_key, hash_audio
+from utils.ingest import audio_name, open_audio_bytes
+from utils.json_stream import JSONStreamParser
+from utils import tracing
 
-def process_cloud(audio_path, text_input, api_key):
+MODEL_NAME = 'gemini-flash-latest'
+
+# Point this at a local stub (see utils/gemini_stub.py) to test without the real API.
+API_BASE_URL = os.environ.get("COACH_GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+MAX_CONCURRENCY = int(os.environ.get("COACH_GEMINI_CONCURRENCY", "8"))
+MAX_RETRIES = 4
+REQUEST_TIMEOUT = 120
+RETRY_STATUSES = {429, 500, 503}
+# Gemini deletes uploaded files after 48 hours; reuse them for a bit less.
+UPLOAD_TTL_SECONDS = 47 * 3600
+
+
+class GeminiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Gemini API error {status}: {message}")
+        self.status = status
+
+
+def is_transient(error):
     """
-    Processes audio/text using Gemini 1.5 Flash.
-    Returns a JSON object with scores and feedback.
+    True for failures worth retrying later: rate limits, server errors and
+    network trouble (not bad input, a bad key or a malformed reply).
     """
-    if not api_key:
-        return {"error": "API Key is missing."}
-        
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
-        # Construct the System Prompt based on the Rubric
-        rubric_text = json.dumps(RUBRIC, indent=2)
-        
-        prompt = f"""
+    if isinstance(error, GeminiError):
+        return error.status in RETRY_STATUSES or error.status in (502, 504)
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError, http.client.HTTPException))
+
+
+def error_result(error):
+    # "retryable" tells job workers to try again instead of failing the job
+    result = {"error": str(error)}
+    if is_transient(error):
+        result["retryable"] = True
+    return result
+
+
+@lru_cache(maxsize=None)
+def build_prompt():
+    """
+    The static prompt prefix. It only depends on the built-in rubric, so it
+    is built once instead of on every request.
+    """
+    # Construct the System Prompt based on the Rubric
+    rubric_text = json.dumps(RUBRIC, indent=2)
+
+    return f"""
         You are a Communication Coach. Analyze the provided audio/text based on the following STRICT Rubric.
-        
+
         RUBRIC JSON:
         {rubric_text}
-        
+
         INSTRUCTIONS:
         1. Analyze the input for:
            - Content & Structure (Salutation, Keywords, Flow)
@@ -54,33 +97,550 @@ def process_cloud(audio_path, text_input, api_key):
             "keywords_found": ["name", ...]
         }}
         """
-        
-        content = [prompt]
-        
-        if audio_path:
-            # Upload file to Gemini
-            audio_file = genai.upload_file(path=audio_path)
-            content.append(audio_file)
-        elif text_input:
-            content.append(f"Input Text: {text_input}")
-        else:
-            return {"error": "No input provided."}
-            
-        response = model.generate_content(content)
-        
-        # Parse JSON from response
+
+
+def parse_result(text):
+    """
+    Parses the model's JSON reply, tolerating markdown code fences.
+    """
+    # Clean up markdown code blocks if present
+    text_res = text.strip()
+    if text_res.startswith("```json"):
+        text_res = text_res[7:]
+    if text_res.endswith("```"):
+        text_res = text_res[:-3]
+    return json.loads(text_res)
+
+
+@lru_cache(maxsize=None)
+def response_schema():
+    """
+    The reply structure as a Gemini responseSchema. Scores come first so a
+    streamed reply delivers them before the long transcript.
+    """
+    labels = DEFAULT_PLAN.labels
+    strings = {"type": "ARRAY", "items": {"type": "STRING"}}
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "category_scores": {
+                "type": "OBJECT",
+                "properties": {label: {"type": "NUMBER"} for label in labels},
+                "required": labels,
+                "propertyOrdering": labels
+            },
+            "overall_score": {"type": "NUMBER"},
+            "feedback": {
+                "type": "OBJECT",
+                "properties": {label: {"type": "STRING"} for label in labels},
+                "required": labels,
+                "propertyOrdering": labels
+            },
+            "fillers_found": strings,
+            "keywords_found": strings,
+            "transcript": {"type": "STRING"}
+        },
+        "required": ["category_scores", "overall_score", "feedback", "transcript"],
+        "propertyOrdering": ["category_scores", "overall_score", "feedback",
+                             "fillers_found", "keywords_found", "transcript"]
+    }
+
+
+def generation_config():
+    # Structured output: the API only returns JSON matching the schema
+    return {"responseMimeType": "application/json", "responseSchema": response_schema()}
+
+
+def clamp_score(value, max_score):
+    """
+    A reply score as a number within [0, max_score], or None if it isn't one.
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return as_score(min(max(value, 0.0), max_score))
+
+
+def validate_result(result, plan=DEFAULT_PLAN):
+    """
+    Checks a parsed reply against the rubric. Scores are clamped to the
+    category maxima and the overall score is recomputed from them. Returns
+    (result, problems); a result missing any category score is an error
+    dict that keeps the parts that were usable under "partial_result".
+    """
+    problems = []
+    if not isinstance(result, dict):
+        return {"error": "Gemini response is not a JSON object."}, ["not an object"]
+    raw_scores = result.get("category_scores") if isinstance(result.get("category_scores"), dict) else {}
+    scores = {}
+    for label in plan.labels:
+        if label not in raw_scores:
+            problems.append(f"missing {label} score")
+            continue
+        score = clamp_score(raw_scores[label], plan.max_scores[label])
+        if score is None:
+            problems.append(f"{label} score {raw_scores[label]!r} is not a number")
+        elif float(raw_scores[label]) != score:
+            problems.append(f"{label} score {raw_scores[label]!r} adjusted to {score}")
+        if score is not None:
+            scores[label] = score
+    result["category_scores"] = scores
+    total = as_score(min(sum(scores.values()), plan.overall_max))
+    if clamp_score(result.get("overall_score"), plan.overall_max) != total:
+        problems.append(f"overall score {result.get('overall_score')!r} recomputed as {total}")
+    result["overall_score"] = total
+    feedback = result.get("feedback") if isinstance(result.get("feedback"), dict) else {}
+    result["feedback"] = {k: v for k, v in feedback.items() if isinstance(v, str)}
+    for field in ("fillers_found", "keywords_found"):
+        values = result.get(field)
+        result[field] = [v for v in values if isinstance(v, str)] if isinstance(values, list) else []
+    if not isinstance(result.get("transcript"), str):
+        result["transcript"] = ""
+    if len(scores) < len(plan.labels):
+        missing = [label for label in plan.labels if label not in scores]
+        return {"error": f"Gemini response is missing scores for {', '.join(missing)}.",
+                "partial_result": result}, problems
+    if problems:
+        result["validation"] = problems
+    return result, problems
+
+
+def audio_mime_type(audio_path):
+    mime, _ = mimetypes.guess_type(audio_name(audio_path))
+    if mime in ("audio/x-wav", "audio/wave"):
+        return "audio/wav"
+    return mime or "audio/mpeg"
+
+
+def _retry_delay(headers, attempt):
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+
+class GeminiClient:
+    """
+    Async client for the Gemini REST API, one per API key and base URL.
+    Blocking HTTP calls run in worker threads; a semaphore bounds how many are
+    in flight, and rate-limit/5xx responses are retried with backoff.
+    Uploaded audio is reused by content hash.
+    """
+
+    def __init__(self, api_key, base_url=API_BASE_URL, model_name=MODEL_NAME,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._uploads = {}  # content hash -> (file dict, expires_at)
+        self._pending_uploads = {}  # content hash -> Future, dedupes concurrent uploads
+
+    def _send(self, method, url, body=None, headers=None):
+        req = urllib.request.Request(url, data=body, method=method, headers=headers or {})
+        req.add_header("x-goog-api-key", self.api_key)
+        try:
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+                return resp.status, dict(resp.headers), resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers or {}), e.read()
+
+    async def request(self, method, path_or_url, body=None, headers=None):
+        url = path_or_url if path_or_url.startswith("http") else self.base_url + path_or_url
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                status, resp_headers, data = await asyncio.to_thread(self._send, method, url, body, headers)
+            if status < 400:
+                return resp_headers, data
+            if status not in RETRY_STATUSES or attempt == self.max_retries:
+                raise GeminiError(status, data.decode(errors="ignore")[:500])
+            await asyncio.sleep(_retry_delay(resp_headers, attempt))
+
+    async def request_json(self, method, path, payload):
+        _, data = await self.request(method, path, json.dumps(payload).encode("utf-8"),
+                                     {"Content-Type": "application/json"})
+        return json.loads(data)
+
+    async def upload_file(self, audio_path):
+        """
+        Uploads audio (a path or an AudioUpload) with the resumable Files API
+        protocol and returns the file dict ({"uri", "mimeType", ...}).
+        Identical content is uploaded once.
+        """
+        digest = await asyncio.to_thread(hash_audio, audio_path)
+        cached = self._uploads.get(digest)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        if digest in self._pending_uploads:
+            return await asyncio.shield(self._pending_uploads[digest])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_uploads[digest] = future
+        try:
+            file_info = await self._upload(audio_path)
+            self._uploads[digest] = (file_info, time.time() + UPLOAD_TTL_SECONDS)
+            future.set_result(file_info)
+            return file_info
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # raised below; don't warn about an unretrieved exception
+            raise
+        finally:
+            del self._pending_uploads[digest]
+
+    async def _upload(self, audio_path):
+        mime = audio_mime_type(audio_path)
+        # The body is the upload's own buffer (or the file mapped), never a copy
+        with open_audio_bytes(audio_path) as data:
+            start_headers, _ = await self.request(
+                "POST", "/upload/v1beta/files",
+                json.dumps({"file": {"display_name": audio_name(audio_path)}}).encode("utf-8"),
+                {
+                    "X-Goog-Upload-Protocol": "resumable",
+                    "X-Goog-Upload-Command": "start",
+                    "X-Goog-Upload-Header-Content-Length": str(len(data)),
+                    "X-Goog-Upload-Header-Content-Type": mime,
+                    "Content-Type": "application/json"
+                }
+            )
+            upload_url = {k.lower(): v for k, v in start_headers.items()}.get("x-goog-upload-url")
+            if not upload_url:
+                raise GeminiError(0, "Upload URL missing from Files API response")
+            _, body = await self.request(
+                "POST", upload_url, data,
+                {
+                    "Content-Length": str(len(data)),
+                    "X-Goog-Upload-Offset": "0",
+                    "X-Goog-Upload-Command": "upload, finalize"
+                }
+            )
+        return json.loads(body)["file"]
+
+    async def generate(self, parts, generation_config=None):
+        """
+        Calls generateContent and returns the concatenated text of the reply.
+        """
+        payload = {"contents": [{"role": "user", "parts": parts}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        response = await self.request_json(
+            "POST", f"/v1beta/models/{self.model_name}:generateContent", payload
+        )
+        candidates = response.get("candidates") or []
+        if not candidates:
+            raise GeminiError(0, f"No candidates in response: {json.dumps(response)[:500]}")
+        return "".join(p.get("text", "") for p in candidates[0].get("content", {}).get("parts", []))
+
+    def _open_stream(self, url, body, headers):
+        req = urllib.request.Request(url, data=body, method="POST", headers=headers)
+        req.add_header("x-goog-api-key", self.api_key)
         try:
-            # Clean up markdown code blocks if present
-            text_res = response.text.strip()
-            if text_res.startswith("```json"):
-                text_res = text_res[7:]
-            if text_res.endswith("```"):
-                text_res = text_res[:-3]
-            
-            result = json.loads(text_res)
-            return result
-        except json.JSONDecodeError:
-            return {"error": "Failed to parse Gemini response.", "raw_response": response.text}
-            
+            resp = urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers or {}), e.read()
+        return resp.status, dict(resp.headers), resp
+
+    async def generate_stream(self, parts, generation_config=None):
+        """
+        Calls streamGenerateContent over server-sent events and yields the
+        reply text piece by piece as it arrives. Failures before the first
+        byte are retried like request(); the stream itself is not.
+        """
+        payload = {"contents": [{"role": "user", "parts": parts}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        url = f"{self.base_url}/v1beta/models/{self.model_name}:streamGenerateContent?alt=sse"
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                status, resp_headers, resp = await asyncio.to_thread(self._open_stream, url, body, headers)
+                if status < 400:
+                    break
+                if status not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise GeminiError(status, resp.decode(errors="ignore")[:500])
+                await asyncio.sleep(_retry_delay(resp_headers, attempt))
+            try:
+                data = []
+                while True:
+                    line = await asyncio.to_thread(resp.readline)
+                    if not line:
+                        break
+                    line = line.decode("utf-8").rstrip("\r\n")
+                    if line.startswith("data:"):
+                        data.append(line[5:].lstrip())
+                    elif not line and data:
+                        # A blank line ends the event
+                        text = _event_text(json.loads("\n".join(data)))
+                        data = []
+                        if text:
+                            yield text
+            finally:
+                resp.close()
+
+
+def _event_text(event):
+    if "error" in event:
+        error = event["error"]
+        raise GeminiError(error.get("code", 0), error.get("message", ""))
+    candidates = event.get("candidates") or []
+    if not candidates:
+        return ""
+    return "".join(p.get("text", "") for p in candidates[0].get("content", {}).get("parts", []))
+
+
+# One event loop thread owns every client, so the per-client semaphore bounds
+# concurrency across all Streamlit sessions in this process.
+_loop = None
+_loop_lock = threading.Lock()
+_clients = {}
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True, name="cloud-engine-loop").start()
+        return _loop
+
+
+def get_client(api_key, base_url=None):
+    """
+    Returns the shared client for this API key and base URL on the running
+    event loop (clients hold loop-bound state such as the semaphore).
+    """
+    key = (api_key, base_url or API_BASE_URL, asyncio.get_running_loop())
+    with _loop_lock:
+        if key not in _clients:
+            _clients[key] = GeminiClient(api_key, base_url=key[1])
+        return _clients[key]
+
+
+async def _request_parts(client, t, audio_path, text_input):
+    parts = [{"text": build_prompt()}]
+    if audio_path:
+        # Upload file to Gemini (reused if this content was uploaded before)
+        with t.stage("upload"):
+            audio_file = await client.upload_file(audio_path)
+        parts.append({"file_data": {"mime_type": audio_file.get("mimeType", audio_mime_type(audio_path)),
+                                    "file_uri": audio_file["uri"]}})
+    else:
+        parts.append({"text": f"Input Text: {text_input}"})
+    return parts
+
+
+def finish_reply(parser, text, failure=None):
+    """
+    Turns a fed JSONStreamParser into a validated result. A reply that was
+    malformed or cut off (failure says how) becomes an error dict that keeps
+    whatever it did contain under "partial_result".
+    """
+    if failure is None and not parser.done:
+        failure = "Gemini response ended before the result was complete"
+    if failure is None:
+        return validate_result(parser.close())[0]
+    reply = parser.partial()
+    if not isinstance(reply, dict):
+        return {"error": "Failed to parse Gemini response.", "raw_response": text}
+    result, _ = validate_result(reply)
+    return {"error": f"{failure}.", "partial_result": result.get("partial_result", result),
+            "raw_response": text}
+
+
+async def process_cloud_async(audio_path, text_input, api_key, base_url=None):
+    """
+    Async version of process_cloud; safe to run many concurrently.
+    """
+    if not api_key:
+        return {"error": "API Key is missing."}
+
+    try:
+        with tracing.trace("cloud") as t:
+            with t.stage("cache_lookup"):
+                key = result_key("cloud", MODEL_NAME, audio_path, text_input)
+                cached = RESULT_CACHE.get(key) if key else None
+            if key is None:
+                return {"error": "No input provided."}
+            if cached is not None:
+                t.count("cache_hits")
+                result = cached
+            else:
+                t.count("cache_misses")
+                client = get_client(api_key, base_url)
+                parts = await _request_parts(client, t, audio_path, text_input)
+
+                with t.stage("generate"):
+                    text = await client.generate(parts, generation_config())
+
+                with t.stage("parse"):
+                    parser = JSONStreamParser()
+                    try:
+                        parser.feed(text)
+                        failure = None
+                    except ValueError as e:
+                        failure = f"Malformed Gemini response ({e})"
+                    result = finish_reply(parser, text, failure)
+                if "error" in result:
+                    return result
+                RESULT_CACHE.set(key, result)
+        result["timings"] = t.to_dict()
+        return result
+
     except Exception as e:
-        return {"error": str(e)}
+        return error_result(e)
+
+
+def process_cloud(audio_path, text_input, api_key, base_url=None):
+    """
+    Processes audio/text using Gemini Flash.
+    audio_path is a file path or an in-memory utils.ingest.AudioUpload.
+    Returns a JSON object with scores and feedback.
+    Runs on the shared cloud event loop, so concurrent callers share the
+    per-key client, upload cache and concurrency limit.
+    """
+    future = asyncio.run_coroutine_threadsafe(
+        process_cloud_async(audio_path, text_input, api_key, base_url), _get_loop()
+    )
+    return future.result()
+
+
+def process_cloud_batch(items, api_key, base_url=None):
+    """
+    Scores (audio_path, text_input) pairs concurrently on the shared cloud
+    event loop, like process_local_batch. Batches share the per-key client,
+    so its concurrency limit and upload reuse span the whole run.
+    """
+    async def run():
+        return await asyncio.gather(*[
+            process_cloud_async(audio_path, text_input, api_key, base_url) for audio_path, text_input in items
+        ])
+    return asyncio.run_coroutine_threadsafe(run(), _get_loop()).result()
+
+
+def _stream_snapshot(reply, plan=DEFAULT_PLAN):
+    # A copy of the scores and feedback received so far, scores clamped
+    reply = reply if isinstance(reply, dict) else {}
+    raw_scores = reply.get("category_scores")
+    scores = {}
+    if isinstance(raw_scores, dict):
+        for label, value in raw_scores.items():
+            if label in plan.max_scores:
+                score = clamp_score(value, plan.max_scores[label])
+                if score is not None:
+                    scores[label] = score
+    feedback = reply.get("feedback")
+    snapshot = {
+        "category_scores": scores,
+        "feedback": {k: v for k, v in feedback.items() if isinstance(v, str)} if isinstance(feedback, dict) else {}
+    }
+    if "overall_score" in reply:
+        snapshot["overall_score"] = clamp_score(reply["overall_score"], plan.overall_max)
+    return snapshot
+
+
+def _is_streamed_field(path):
+    if path[:1] in (("category_scores",), ("feedback",)):
+        return len(path) == 2
+    return path == ("overall_score",)
+
+
+async def process_cloud_stream_async(audio_path, text_input, api_key, base_url=None):
+    """
+    Streaming variant of process_cloud_async. Yields
+    {"type": "partial", "path": ("category_scores", "Content"), "value": 30, "result": ...}
+    as each score and feedback field of the reply completes (result holds
+    everything received so far), then {"type": "result", "result": <process_cloud shape>}.
+    """
+    if not api_key:
+        yield {"type": "result", "result": {"error": "API Key is missing."}}
+        return
+
+    started = time.perf_counter()
+    t = tracing.Trace("cloud_stream")
+    with t.stage("cache_lookup"):
+        key = result_key("cloud", MODEL_NAME, audio_path, text_input)
+        cached = RESULT_CACHE.get(key) if key else None
+    if key is None:
+        t.finish()
+        yield {"type": "result", "result": {"error": "No input provided."}}
+        return
+    if cached is not None:
+        t.count("cache_hits")
+        cached["timings"] = t.finish().to_dict()
+        yield {"type": "result", "result": cached}
+        return
+    t.count("cache_misses")
+
+    parser = JSONStreamParser()
+    pieces = []
+    failure = None
+    first_score = None
+    try:
+        client = get_client(api_key, base_url)
+        parts = await _request_parts(client, t, audio_path, text_input)
+        with t.stage("generate"):
+            async for piece in client.generate_stream(parts, generation_config()):
+                pieces.append(piece)
+                if failure:
+                    continue
+                try:
+                    events = parser.feed(piece)
+                except ValueError as e:
+                    failure = f"Malformed Gemini response ({e})"
+                    continue
+                for path, value in events:
+                    if not _is_streamed_field(path):
+                        continue
+                    if first_score is None and path[0] == "category_scores":
+                        first_score = time.perf_counter() - started
+                        tracing.observe("cloud_first_score_seconds", first_score)
+                    yield {"type": "partial", "path": path, "value": value,
+                           "result": _stream_snapshot(parser.partial())}
+    except Exception as e:
+        if parser.partial() is None:
+            t.finish()
+            yield {"type": "result", "result": error_result(e)}
+            return
+        failure = f"Gemini stream failed ({e})"
+
+    with t.stage("parse"):
+        result = finish_reply(parser, "".join(pieces), failure)
+    if "error" not in result:
+        RESULT_CACHE.set(key, result)
+    result["timings"] = t.finish().to_dict()
+    if first_score is not None:
+        result["timings"]["first_score_ms"] = round(first_score * 1000, 2)
+    yield {"type": "result", "result": result}
+
+
+def process_cloud_stream(audio_path, text_input, api_key, base_url=None):
+    """
+    Streaming variant of process_cloud: a generator of the events of
+    process_cloud_stream_async, run on the shared cloud event loop. Closing
+    the generator early cancels the request.
+    """
+    events = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for event in process_cloud_stream_async(audio_path, text_input, api_key, base_url):
+                events.put(event)
+        except Exception as e:
+            events.put({"type": "result", "result": error_result(e)})
+        finally:
+            events.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _get_loop())
+    try:
+        while True:
+            event = events.get()
+            if event is done:
+                return
+            yield event
+    finally:
+        future.cancel()
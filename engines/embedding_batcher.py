@@ -0,0 +1,123 @@
+"""
+Dynamic micro-batching for sentence embeddings.
+
+Each session's request only embeds a few sentences, and most of a small
+encode() call is fixed per-call cost. EmbeddingBatcher queues encode
+requests from every thread, waits up to COACH_EMBED_BATCH_WINDOW_MS for more
+(or until COACH_EMBED_MAX_BATCH sentences are waiting), runs them as one
+encode() call (sentence-transformers sorts the batch by length and pads each
+mini-batch) and hands every caller its own rows through a future.
+
+Batch size, queue wait and queue depth are exported with the pipeline
+metrics (utils/tracing.py).
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils import tracing
+
+BATCH_WINDOW = float(os.environ.get("COACH_EMBED_BATCH_WINDOW_MS", "5")) / 1000
+MAX_BATCH = int(os.environ.get("COACH_EMBED_MAX_BATCH", "256"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class EmbeddingBatcher:
+    """
+    Wraps a SentenceTransformer (or anything with its encode()) so concurrent
+    encode() calls share forward passes. encode() blocks the caller until its
+    batch is done and returns a float32 numpy array, one row per sentence.
+    """
+
+    def __init__(self, model, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self.sentences = 0
+        self._reset()
+        # The batching thread does not survive a fork; the child starts its own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        sentences = list(sentences)
+        if not sentences:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+        else:
+            self._ensure_thread()
+            future = Future()
+            self._queue.put((sentences, future, time.perf_counter()))
+            embeddings = future.result()
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "sentences": self.sentences,
+            "mean_batch_size": round(self.sentences / self.batches, 2) if self.batches else None,
+            "queue_depth": self._queue.qsize()
+        }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="embedding-batcher")
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            started = time.perf_counter()
+            tracing.observe("embed_batch_sentences", size, BATCH_SIZE_BUCKETS)
+            tracing.observe("embed_batch_requests", len(batch), BATCH_SIZE_BUCKETS)
+            for _, _, queued in batch:
+                tracing.observe("embed_queue_wait_seconds", started - queued)
+            tracing.set_gauge("embed_queue_depth", self._queue.qsize())
+            try:
+                embeddings = self.model.encode([s for sentences, _, _ in batch for s in sentences],
+                                               convert_to_numpy=True)
+                embeddings = np.asarray(embeddings, dtype=np.float32)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            tracing.observe("embed_batch_seconds", time.perf_counter() - started)
+            self.batches += 1
+            self.requests += len(batch)
+            self.sentences += size
+            start = 0
+            for sentences, future, _ in batch:
+                future.set_result(embeddings[start:start + len(sentences)])
+                start += len(sentences)
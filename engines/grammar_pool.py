@@ -0,0 +1,226 @@
+import bisect
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import language_tool_python
+
+POOL_SIZE = int(os.environ.get("COACH_LT_POOL_SIZE", "2"))
+CHECK_TIMEOUT = float(os.environ.get("COACH_LT_TIMEOUT", "15"))
+HEALTH_INTERVAL = float(os.environ.get("COACH_LT_HEALTH_INTERVAL", "60"))
+
+# Sentences are grouped into chunks of at least this many characters so short
+# transcripts don't pay one HTTP round-trip per sentence.
+MIN_CHUNK_CHARS = 400
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_chunks(text, n_chunks, min_chars=MIN_CHUNK_CHARS):
+    """
+    Splits text on sentence boundaries into at most n_chunks pieces of
+    roughly equal length.
+    """
+    sentences = [s for s in _SENTENCE_END.split(text) if s.strip()]
+    if not sentences:
+        return []
+    target = max(min_chars, len(text) // max(n_chunks, 1) + 1)
+    chunks, current, size = [], [], 0
+    for sentence in sentences:
+        current.append(sentence)
+        size += len(sentence) + 1
+        if size >= target:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class LanguageToolPool:
+    """
+    A fixed set of local LanguageTool servers shared by all sessions.
+    Long texts are split by sentence and checked in parallel across servers.
+    A check that fails or exceeds `timeout` returns None, which callers treat
+    as "grammar check skipped".
+    """
+
+    def __init__(self, size=POOL_SIZE, language='en-US', timeout=CHECK_TIMEOUT,
+                 health_interval=HEALTH_INTERVAL):
+        self.language = language
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._tools = []
+        self._closed = False
+        self._forked = False
+        for _ in range(size):
+            try:
+                self._add(self._start())
+            except Exception as e:
+                print(f"Failed to start LanguageTool server: {e}")
+        if not self._tools:
+            raise RuntimeError("No LanguageTool server could be started (Java missing?)")
+        self._executor = ThreadPoolExecutor(max_workers=len(self._tools) * 2,
+                                            thread_name_prefix="languagetool")
+        if health_interval:
+            threading.Thread(target=self._health_loop, args=(health_interval,),
+                             daemon=True, name="languagetool-health").start()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Forked workers keep using the parent's servers (they are separate
+        # JVM processes reached over HTTP) but need their own threads and locks.
+        # Health checks stay with the parent.
+        self._forked = True
+        self._lock = threading.Lock()
+        idle = queue.Queue()
+        for tool in self._tools:
+            idle.put(tool)
+        self._idle = idle
+        self._executor = ThreadPoolExecutor(max_workers=len(self._tools) * 2,
+                                            thread_name_prefix="languagetool")
+
+    @property
+    def size(self):
+        return len(self._tools)
+
+    def _start(self):
+        return language_tool_python.LanguageTool(self.language)
+
+    def _add(self, tool):
+        with self._lock:
+            self._tools.append(tool)
+        self._idle.put(tool)
+
+    def _replace(self, tool):
+        with self._lock:
+            if tool in self._tools:
+                self._tools.remove(tool)
+        if not self._forked:  # a shared server is the parent's to stop
+            try:
+                tool.close()
+            except Exception:
+                pass
+        try:
+            self._add(self._start())
+        except Exception as e:
+            print(f"Failed to restart LanguageTool server: {e}")
+
+    def _check_chunk(self, chunk, deadline):
+        tool = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        try:
+            matches = tool.check(chunk)
+        except Exception:
+            self._replace(tool)
+            raise
+        self._idle.put(tool)
+        return matches
+
+    def check(self, text):
+        """
+        Returns the list of LanguageTool matches for text, or None if the
+        pool could not answer within the timeout.
+        """
+        chunks = split_chunks(text, self.size)
+        if not chunks:
+            return []
+        results = self._check_chunks(chunks)
+        if results is None:
+            return None
+        return [m for matches in results for m in matches]
+
+    def check_segments(self, segments):
+        """
+        Checks independent pieces of text (e.g. edited sentences) and returns
+        one match list per segment, or None if the pool could not answer.
+        Segments are packed into chunks like check() does, so many short
+        segments still cost only a few round-trips; matches are mapped back
+        to their segment by offset.
+        """
+        target = max(MIN_CHUNK_CHARS, sum(len(s) + 1 for s in segments) // max(self.size, 1) + 1)
+        chunks, layouts = [], []  # layout: (segment index, start offset) per segment in the chunk
+        current, layout, size = [], [], 0
+        for i, segment in enumerate(segments):
+            layout.append((i, size))
+            current.append(segment)
+            size += len(segment) + 1
+            if size >= target:
+                chunks.append(" ".join(current))
+                layouts.append(layout)
+                current, layout, size = [], [], 0
+        if current:
+            chunks.append(" ".join(current))
+            layouts.append(layout)
+        results = self._check_chunks(chunks)
+        if results is None:
+            return None
+        per_segment = [[] for _ in segments]
+        for layout, matches in zip(layouts, results):
+            starts = [start for _, start in layout]
+            for m in matches:
+                per_segment[layout[max(0, bisect.bisect_right(starts, m.offset) - 1)][0]].append(m)
+        return per_segment
+
+    def _check_chunks(self, chunks):
+        if self._closed:
+            return None
+        deadline = time.monotonic() + self.timeout
+        futures = [self._executor.submit(self._check_chunk, c, deadline) for c in chunks]
+        results = []
+        try:
+            for future in futures:
+                results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+        except (FutureTimeout, queue.Empty):
+            print("Grammar check timed out; skipping.")
+            return None
+        except Exception as e:
+            print(f"Grammar check failed: {e}")
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    def health_check(self):
+        """
+        Pings every idle server and restarts the ones that don't answer.
+        Returns the number of healthy servers.
+        """
+        healthy = 0
+        for _ in range(self._idle.qsize()):
+            try:
+                tool = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                tool.check("This is a test.")
+            except Exception as e:
+                print(f"LanguageTool server unhealthy, restarting: {e}")
+                self._replace(tool)
+                continue
+            self._idle.put(tool)
+            healthy += 1
+        return healthy
+
+    def _health_loop(self, interval):
+        while not self._closed:
+            time.sleep(interval)
+            if not self._closed:
+                self.health_check()
+
+    def close(self):
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            tools, self._tools = self._tools, []
+        if self._forked:
+            return
+        for tool in tools:
+            try:
+                tool.close()
+            except Exception:
+                pass
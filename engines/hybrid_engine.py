@@ -0,0 +1,109 @@
+"""
+The "auto" engine: score locally, and ask Gemini only where the local
+result is doubtful.
+
+Every submission is scored by the local engine first. A category is
+escalated to the cloud engine only when its local score is low-confidence:
+
+    Content     keywords were matched by plain string search (no MiniLM)
+    Grammar     the grammar check was skipped, or the error rate or TTR
+                lies within METRIC_MARGINS of a rubric break
+    Engagement  VADER positivity lies within METRIC_MARGINS of a break
+
+Speech rate and filler counts are measured the same way from the same
+transcript either way, so they always stay local. Escalation sends the
+transcript the local engine already produced as text (never the audio), and
+only those categories' scores and feedback are taken from the reply. Each
+result records where every category came from in "score_sources".
+"""
+import numpy as np
+
+from engines import local_engine
+from engines.cloud_engine import process_cloud
+from utils import tracing
+from utils.rubric import as_score, get_plan
+
+# How far a locally measured metric may be off; within this distance of a
+# rubric break the category could land on either side of it
+METRIC_MARGINS = {
+    "errors_per_100": 0.5,
+    "ttr": 0.03,
+    "positivity": 0.05,
+}
+ESCALATABLE = ("Content", "Grammar", "Engagement")
+
+
+def uncertain_categories(result, plan):
+    """
+    The categories of a local result worth a second opinion (see module doc).
+    """
+    metrics = result.get("metrics") or {}
+    uncertain = set()
+    if metrics.get("errors_per_100", 0) is None:
+        uncertain.add("Grammar")
+    if local_engine.get_keyword_index(plan) is None:
+        uncertain.add("Content")
+    measured = {
+        name: np.array([value], dtype=float)
+        for name, value in metrics.items()
+        if name in METRIC_MARGINS and value is not None
+    }
+    if measured:
+        for label, near in plan.near_breaks(measured, METRIC_MARGINS).items():
+            if near[0]:
+                uncertain.add(label)
+    return [label for label in ESCALATABLE if label in uncertain]
+
+
+def process_auto(audio_path, text_input, api_key, rubric=None, base_url=None):
+    """
+    Scores with the local engine and escalates low-confidence categories to
+    Gemini (see module doc). Without an API key the local result is returned
+    as is, with the categories that would have been escalated listed.
+    """
+    plan = get_plan(rubric)
+    with tracing.trace("auto") as t:
+        with t.stage("local"):
+            result = local_engine.process_local(audio_path, text_input, rubric=rubric)
+        if "error" in result:
+            return result
+        local_timings = result.pop("timings", None)
+        with t.stage("decide"):
+            uncertain = uncertain_categories(result, plan)
+        sources = {label: "local" for label in result["category_scores"]}
+
+        if uncertain and api_key:
+            t.count("escalations")
+            t.count("escalated_categories", len(uncertain))
+            with t.stage("cloud"):
+                cloud = process_cloud(None, result["transcript"], api_key, base_url)
+            if "error" in cloud:
+                result["escalation_error"] = cloud["error"]
+            else:
+                merge_cloud_scores(result, cloud, uncertain, plan, sources)
+        result["escalated"] = uncertain
+        result["score_sources"] = sources
+    result["timings"] = t.to_dict()
+    if local_timings:
+        result["timings"]["local"] = local_timings
+    return result
+
+
+def merge_cloud_scores(result, cloud, categories, plan, sources):
+    """
+    Takes the given categories' scores (clamped to the rubric maxima) and
+    feedback from a cloud result, and recomputes the overall score.
+    """
+    cloud_scores = cloud.get("category_scores") or {}
+    for label in categories:
+        try:
+            score = float(cloud_scores[label])
+        except (KeyError, TypeError, ValueError):
+            continue
+        max_score = plan.max_scores.get(label, score)
+        result["category_scores"][label] = as_score(min(max(score, 0.0), max_score))
+        feedback = (cloud.get("feedback") or {}).get(label)
+        if feedback:
+            result["feedback"][label] = feedback
+        sources[label] = "cloud"
+    result["overall_score"] = as_score(min(sum(result["category_scores"].values()), plan.overall_max))
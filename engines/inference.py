@@ -0,0 +1,144 @@
+"""
+CPU inference backends for the local engine's Whisper and MiniLM models.
+
+Transcription (COACH_WHISPER_BACKEND):
+    openai        openai-whisper on PyTorch, float32 (default)
+    ctranslate2   faster-whisper on CTranslate2, quantized per COACH_WHISPER_COMPUTE
+                  (int8 by default)
+
+Sentence embeddings (COACH_EMBED_BACKEND):
+    torch         sentence-transformers on PyTorch, float32 (default)
+    torch-int8    the same model with its Linear layers dynamically quantized
+    onnx          sentence-transformers on ONNX Runtime
+    onnx-int8     ONNX Runtime with the int8 export named by COACH_EMBED_ONNX_FILE
+
+COACH_WHISPER_MODEL picks the Whisper size (tiny, base or small).
+COACH_THREADS caps intra-op threads per process; worker pools divide the
+machine's cores between their processes with set_threads().
+
+Use benchmarks/compare_backends.py to check a backend's scores against the
+default before switching to it.
+"""
+import os
+import sys
+
+WHISPER_SIZES = ("tiny", "base", "small")
+WHISPER_BACKENDS = ("openai", "ctranslate2")
+EMBED_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+WHISPER_BACKEND = os.environ.get("COACH_WHISPER_BACKEND", "openai")
+WHISPER_SIZE = os.environ.get("COACH_WHISPER_MODEL", "base")
+WHISPER_COMPUTE = os.environ.get("COACH_WHISPER_COMPUTE", "int8")
+EMBED_BACKEND = os.environ.get("COACH_EMBED_BACKEND", "torch")
+EMBED_ONNX_FILE = os.environ.get("COACH_EMBED_ONNX_FILE", "onnx/model_qint8_avx2.onnx")
+
+_threads = int(os.environ["COACH_THREADS"]) if os.environ.get("COACH_THREADS") else None
+
+
+def threads_per_worker(n_workers):
+    """
+    Cores available to each of n_workers processes sharing this machine.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, n_workers))
+
+
+def set_threads(n):
+    """
+    Caps intra-op threads for this process. Call it first thing in a worker
+    process: the OpenMP/MKL variables only apply to libraries loaded after.
+    """
+    global _threads
+    _threads = n
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(n)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(n)
+
+
+def get_threads():
+    return _threads
+
+
+def _apply_torch_threads():
+    if _threads:
+        import torch
+        torch.set_num_threads(_threads)
+
+
+def whisper_id(backend=WHISPER_BACKEND, size=WHISPER_SIZE, compute_type=WHISPER_COMPUTE):
+    """
+    Names the transcription model for cache keys; the default backend keeps
+    the plain "whisper-<size>" name.
+    """
+    if backend == "openai":
+        return f"whisper-{size}"
+    return f"whisper-{size}-{backend}-{compute_type}"
+
+
+def embed_id(model_name, backend=EMBED_BACKEND):
+    return model_name if backend == "torch" else f"{model_name}-{backend}"
+
+
+class CTranslate2Whisper:
+    """
+    faster-whisper behind openai-whisper's transcribe() interface and result
+    shape ({"text", "segments": [{"start", "end", "text", "words"}], "language"}).
+    """
+
+    def __init__(self, size=WHISPER_SIZE, compute_type=WHISPER_COMPUTE, threads=None):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(size, device="cpu", compute_type=compute_type,
+                                  cpu_threads=threads or 0)
+
+    def transcribe(self, audio, word_timestamps=False, **kwargs):
+        # Greedy decoding, like openai-whisper's transcribe() default, so the
+        # two backends differ only in the runtime and not the search
+        kwargs.setdefault("beam_size", 1)
+        segments, info = self.model.transcribe(audio, word_timestamps=word_timestamps, **kwargs)
+        out = []
+        for seg in segments:
+            out.append({
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text,
+                "words": [
+                    {"word": w.word, "start": w.start, "end": w.end, "probability": w.probability}
+                    for w in (seg.words or [])
+                ]
+            })
+        return {"text": "".join(seg["text"] for seg in out), "segments": out, "language": info.language}
+
+
+def load_whisper(backend=WHISPER_BACKEND, size=WHISPER_SIZE, compute_type=WHISPER_COMPUTE):
+    if size not in WHISPER_SIZES:
+        raise ValueError(f"Unknown Whisper size {size!r}; expected one of {', '.join(WHISPER_SIZES)}")
+    if backend == "openai":
+        _apply_torch_threads()
+        import whisper
+        return whisper.load_model(size)
+    if backend == "ctranslate2":
+        return CTranslate2Whisper(size, compute_type, _threads)
+    raise ValueError(f"Unknown Whisper backend {backend!r}; expected one of {', '.join(WHISPER_BACKENDS)}")
+
+
+def load_embedder(model_name, backend=EMBED_BACKEND):
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        _apply_torch_threads()
+        return SentenceTransformer(model_name)
+    if backend == "torch-int8":
+        _apply_torch_threads()
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend in ("onnx", "onnx-int8"):
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if _threads:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = _threads
+            model_kwargs["session_options"] = options
+        if backend == "onnx-int8":
+            model_kwargs["file_name"] = EMBED_ONNX_FILE
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBED_BACKENDS)}")
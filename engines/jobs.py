@@ -0,0 +1,384 @@
+import gc
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from engines.inference import set_threads, threads_per_worker
+
+JOBS_DB = os.environ.get(
+    "COACH_JOBS_DB",
+    os.path.join(os.path.expanduser("~"), ".cache", "communication_coach", "jobs.db")
+)
+DEFAULT_TIMEOUT = float(os.environ.get("COACH_JOB_TIMEOUT", "600"))
+DEFAULT_MAX_ATTEMPTS = 2
+RETRY_DELAY = 5  # seconds before a failed attempt is picked up again
+JOB_RETENTION = 24 * 3600  # finished jobs are purged after this many seconds
+# A running job this far past its deadline was left by a pool that is gone
+# (its own supervisor fails it at the deadline); any pool may then fail it
+ABANDONED_GRACE = 300
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    timeout REAL NOT NULL,
+    worker_pid INTEGER,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    deadline REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at);
+"""
+
+
+class JobQueue:
+    """
+    A scoring job queue stored in SQLite, shared by the UI and worker
+    processes on one machine. No broker is needed: workers claim jobs with an
+    atomic UPDATE inside an IMMEDIATE transaction.
+    """
+
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+            # Queues created before jobs recorded the claiming pool
+            if "owner" not in {r["name"] for r in db.execute("PRAGMA table_info(jobs)")}:
+                db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def submit(self, engine, audio_path=None, text_input=None, api_key=None,
+               timeout=DEFAULT_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS, cleanup_audio=False):
+        """
+        Queues a scoring job and returns its id. engine is "local", "cloud" or "auto".
+        cleanup_audio=True deletes audio_path once the job has finished.
+        """
+        job_id = uuid.uuid4().hex
+        payload = {
+            "audio_path": audio_path,
+            "text_input": text_input,
+            "api_key": api_key,
+            "cleanup_audio": cleanup_audio
+        }
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, engine, payload, max_attempts, timeout, created_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, engine, json.dumps(payload), max_attempts, timeout, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns the job as a dict (without its payload), or None.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("payload")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def claim(self, worker_pid=None, owner=None):
+        """
+        Atomically moves the oldest available queued job to running and returns
+        it with its payload, or None if there is nothing to do. owner names the
+        pool supervising worker_pid (see WorkerPool).
+        """
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = ? AND available_at <= ? "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker_pid = ?, owner = ?, "
+                "started_at = ?, deadline = ? WHERE id = ?",
+                (RUNNING, worker_pid, owner, now, now + row["timeout"], row["id"])
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def complete(self, job_id, result):
+        self._finish(job_id, DONE, result=result)
+
+    def fail(self, job_id, error, result=None, retry=True):
+        """
+        Records a failed attempt. With retry, the job is queued again after
+        RETRY_DELAY while attempts remain; otherwise it is marked failed.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            if retry and row["attempts"] < row["max_attempts"]:
+                db.execute(
+                    "UPDATE jobs SET status = ?, error = ?, worker_pid = NULL, owner = NULL, deadline = NULL, "
+                    "available_at = ? WHERE id = ?",
+                    (QUEUED, error, time.time() + RETRY_DELAY, job_id)
+                )
+                return
+        self._finish(job_id, FAILED, result=result, error=error)
+
+    def retry(self, job_id):
+        """
+        Puts a failed job back on the queue with a fresh attempt budget.
+        """
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, error = NULL, available_at = ? "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, FAILED)
+            )
+
+    def expired(self, owner):
+        """
+        Running jobs of this owner past their deadline, and any owner's long
+        past it (ABANDONED_GRACE), as (job_id, worker_pid, owner) tuples.
+        """
+        now = time.time()
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, worker_pid, owner FROM jobs WHERE status = ? "
+                "AND ((owner = ? AND deadline < ?) OR deadline < ?)",
+                (RUNNING, owner, now, now - ABANDONED_GRACE)
+            ).fetchall()
+        return [(r["id"], r["worker_pid"], r["owner"]) for r in rows]
+
+    def orphaned(self, owner, live_pids):
+        """
+        Running jobs of this owner whose worker process is gone, as job ids.
+        """
+        with self._connect() as db:
+            rows = db.execute("SELECT id, worker_pid FROM jobs WHERE status = ? AND owner = ?",
+                              (RUNNING, owner)).fetchall()
+        return [r["id"] for r in rows if r["worker_pid"] not in live_pids]
+
+    def counts(self):
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def purge(self, max_age=JOB_RETENTION):
+        """
+        Deletes finished and failed jobs older than max_age seconds, along with
+        any audio they still own. Returns the number of jobs removed.
+        """
+        cutoff = time.time() - max_age
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, payload FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, cutoff)
+            ).fetchall()
+            for row in rows:
+                _remove_audio(json.loads(row["payload"]))
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(r["id"],) for r in rows])
+        return len(rows)
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as db:
+            row = db.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            payload = json.loads(row["payload"])
+            # Failed jobs keep their audio and API key so they can be retried;
+            # purge() removes both
+            if status == DONE:
+                _remove_audio(payload)
+                payload["api_key"] = None
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = ?, worker_pid = NULL, "
+                "owner = NULL, deadline = NULL, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 json.dumps(payload), time.time(), job_id)
+            )
+
+
+def _remove_audio(payload):
+    if payload.get("cleanup_audio") and payload.get("audio_path"):
+        try:
+            os.remove(payload["audio_path"])
+        except OSError:
+            pass
+
+
+def run_job(job):
+    """
+    Scores one claimed job in this process and returns the result dict.
+    """
+    payload = job["payload"]
+    if job["engine"] == "cloud":
+        from engines.cloud_engine import process_cloud
+        return process_cloud(payload["audio_path"], payload["text_input"], payload["api_key"])
+    if job["engine"] == "auto":
+        from engines.hybrid_engine import process_auto
+        return process_auto(payload["audio_path"], payload["text_input"], payload["api_key"])
+    from engines.local_engine import process_local
+    return process_local(payload["audio_path"], payload["text_input"])
+
+
+def worker_main(db_path=JOBS_DB, poll_interval=0.5, warm=True, threads=None, owner=None):
+    """
+    Worker process loop: claim a job, score it, record the outcome. owner is
+    the id of the pool supervising this worker.
+    Each worker keeps its own local models for its whole lifetime; threads
+    caps their intra-op threads so workers don't oversubscribe the cores.
+    """
+    if threads:
+        set_threads(threads)
+    queue = JobQueue(db_path)
+    if warm:
+        from engines.local_engine import warm_up
+        warm_up(background=True)
+    pid = os.getpid()
+    while True:
+        job = queue.claim(worker_pid=pid, owner=owner)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            result = run_job(job)
+        except Exception as e:
+            queue.fail(job["id"], f"{type(e).__name__}: {e}")
+            continue
+        if "error" in result:
+            # Engine-level errors (bad input, missing key) are final; transient
+            # ones (rate limits, network) are retried while attempts remain
+            queue.fail(job["id"], result["error"], result=result, retry=result.get("retryable", False))
+        else:
+            queue.complete(job["id"], result)
+
+
+class WorkerPool:
+    """
+    Runs n worker processes against a JobQueue and supervises them: dead
+    workers are replaced, and a worker whose job passes its timeout is killed
+    and its job failed (and retried if attempts remain).
+
+    By default each worker is spawned fresh and loads its own models. With
+    share_models=True this process loads them once and forks the workers, so
+    they share the weights copy-on-write (and the LanguageTool servers);
+    that needs a single-threaded parent, see engines/model_host.py.
+
+    Several pools may share one queue (e.g. one per Streamlit process). Each
+    only supervises the jobs its own workers claimed, recorded under its id.
+    """
+
+    def __init__(self, n_workers=None, db_path=JOBS_DB, supervise_interval=1.0, share_models=False):
+        self.n_workers = n_workers or int(os.environ.get("COACH_WORKERS", "2"))
+        self.db_path = db_path
+        self.queue = JobQueue(db_path)
+        self.supervise_interval = supervise_interval
+        self.share_models = share_models
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._ctx = multiprocessing.get_context("fork" if share_models else "spawn")
+        self._workers = []
+        self._stopped = threading.Event()
+        self._supervisor = None
+
+    def _spawn(self):
+        proc = self._ctx.Process(target=worker_main, args=(self.db_path,), daemon=True,
+                                 kwargs={"threads": threads_per_worker(self.n_workers),
+                                         "warm": not self.share_models,
+                                         "owner": self.id},
+                                 name="coach-worker")
+        proc.start()
+        return proc
+
+    def _preload(self):
+        from engines.local_engine import warm_up
+        # Load single-threaded: a parent that has run multi-threaded OpenMP
+        # regions can't fork safely. Workers set their own thread count.
+        set_threads(1)
+        warm_up(background=False)
+        # Keep the collector from touching (and so copying) the loaded objects
+        gc.collect()
+        gc.freeze()
+
+    def start(self, background=True):
+        """
+        Starts the workers. background=False supervises in the calling thread
+        and only returns after stop(); forking workers need that, as a
+        supervisor thread would make every later fork multi-threaded.
+        """
+        if self.share_models:
+            self._preload()
+        self._workers = [self._spawn() for _ in range(self.n_workers)]
+        if not background:
+            self._supervise()
+            return self
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True, name="coach-worker-supervisor")
+        self._supervisor.start()
+        return self
+
+    def _supervise(self):
+        last_purge = 0
+        while not self._stopped.wait(self.supervise_interval):
+            if time.time() - last_purge > 3600:
+                self.queue.purge()
+                last_purge = time.time()
+            for job_id, pid, owner in self.queue.expired(self.id):
+                if owner == self.id:
+                    for proc in self._workers:
+                        if proc.pid == pid and proc.is_alive():
+                            os.kill(pid, signal.SIGKILL)
+                            proc.join(5)
+                    self.queue.fail(job_id, "Timed out")
+                else:
+                    self.queue.fail(job_id, "Worker pool exited")
+            self._workers = [p if p.is_alive() else self._spawn() for p in self._workers]
+            for job_id in self.queue.orphaned(self.id, {p.pid for p in self._workers}):
+                self.queue.fail(job_id, "Worker exited")
+
+    def status(self):
+        return {
+            "workers": sum(p.is_alive() for p in self._workers),
+            "jobs": self.queue.counts()
+        }
+
+    def stop(self):
+        self._stopped.set()
+        for proc in self._workers:
+            proc.terminate()
+        for proc in self._workers:
+            proc.join(5)
@@ -1,79 +1,240 @@
-import whisper
-try:
-    from sentence_transformers import SentenceTransformer, util
-    ST_AVAILABLE = True
-except ImportError:
-    ST_AVAILABLE = False
-    print("Sentence Transformers not available. Using string matching fallback.")
-
-import language_tool_python
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-import streamlit as st
+import base64
+import importlib.util
 import re
 import math
-from utils.rubric import RUBRIC, calculate_wpm, get_speech_rate_score, get_filler_score
-import subprocess
+from utils.rubric import DEFAULT_PLAN, get_plan, as_score
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import multiprocessing
+import numpy as np
+import threading
+from utils.audio import SAMPLE_RATE, stream_pcm, vad_segments, ingest_audio
+from utils.cache import RESULT_CACHE, SENTENCE_MEMO, result_key
+from utils import tracing
+from utils.lexical import TOKEN_PATTERN, analyze, get_lexicon, highlight_spans
+from engines.model_registry import ModelRegistry
+from engines import inference
 
+# Heavy libraries (torch, whisper, sentence_transformers, language_tool_python,
+# vaderSentiment) are imported inside the loaders below, so importing this
+# module stays cheap when only the cloud engine is used.
+ST_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+if not ST_AVAILABLE:
+    print("Sentence Transformers not available. Using string matching fallback.")
 
-@st.cache_resource
-def load_models():
+# Model size and runtime are configurable, see engines/inference.py
+WHISPER_MODEL_NAME = inference.WHISPER_SIZE
+ST_MODEL_NAME = 'all-MiniLM-L6-v2'
+KEYWORD_SIMILARITY_THRESHOLD = 0.4
+# Identifies every model (and backend) whose output feeds a local result (used in cache keys)
+LOCAL_MODEL_ID = f"{inference.whisper_id()}+{inference.embed_id(ST_MODEL_NAME)}"
+
+# On-disk cache for derived artifacts (keyword embeddings). Set to "" to disable.
+CACHE_DIR = os.environ.get(
+    "COACH_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "communication_coach")
+)
+
+# Socket of a model server (python -m engines.model_host serve). When set,
+# Whisper, MiniLM and LanguageTool run there and this process loads none of them.
+MODEL_SERVER = os.environ.get("COACH_MODEL_SERVER", "")
+
+
+def build_keyword_index(st_model, model_name=ST_MODEL_NAME, cache_dir=CACHE_DIR, plan=DEFAULT_PLAN):
     """
-    Loads and caches all necessary models for the local engine.
+    Encodes every rubric keyword in one batch and returns the keyword index.
+    The embeddings only change with the model or the rubric, so they are saved
+    to disk keyed by model name plus the rubric version and reloaded on later starts.
     """
-    print("Loading Whisper...")
-    whisper_model = whisper.load_model("base")
-    
-    st_model = None
-    if ST_AVAILABLE:
-        try:
-            print("Loading Sentence Transformer...")
-            st_model = SentenceTransformer('all-MiniLM-L6-v2')
-        except Exception as e:
-            print(f"Failed to load Sentence Transformer: {e}")
-            st_model = None
-    
+    keywords = plan.keywords
+    points = plan.keyword_points.tolist()
+
+    embeddings = None
+    cache_path = None
+    import torch
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"keywords-{model_name.replace('/', '_')}-{plan.version}.pt")
+        if os.path.exists(cache_path):
+            try:
+                embeddings = torch.load(cache_path, map_location="cpu").to(st_model.device)
+                if embeddings.shape[0] != len(keywords):
+                    embeddings = None
+            except Exception as e:
+                print(f"Ignoring unreadable keyword cache {cache_path}: {e}")
+                embeddings = None
+
+    if embeddings is None:
+        embeddings = st_model.encode(keywords, convert_to_tensor=True)
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                torch.save(embeddings.cpu(), cache_path)
+            except Exception as e:
+                print(f"Failed to save keyword cache: {e}")
+
+    return {"keywords": keywords, "points": points, "embeddings": embeddings}
+
+
+def match_keywords(keyword_index, sentence_embeddings, item_ids=None, n_items=1):
+    """
+    Returns, per item, the (keyword, points) pairs whose embedding is close to
+    at least one of that item's sentences.
+    One (keywords x sentences) cosine matrix covers every item; item_ids maps
+    each sentence row to the item it came from (all item 0 when omitted).
+    """
+    import torch
+    from sentence_transformers import util
+    cosine_scores = util.cos_sim(keyword_index["embeddings"], sentence_embeddings)
+    hits = (cosine_scores > KEYWORD_SIMILARITY_THRESHOLD).float()
+    if item_ids is None:
+        item_ids = [0] * hits.shape[1]
+    # (sentences x items) membership matrix folds sentence hits into item hits
+    membership = torch.zeros(hits.shape[1], n_items, device=hits.device)
+    membership[torch.arange(hits.shape[1], device=hits.device),
+               torch.tensor(item_ids, device=hits.device)] = 1.0
+    item_hits = (hits @ membership > 0).T.tolist()
+    return [
+        [
+            (kw, pts)
+            for kw, pts, hit in zip(keyword_index["keywords"], keyword_index["points"], row)
+            if hit
+        ]
+        for row in item_hits
+    ]
+
+
+def _load_whisper():
+    if MODEL_SERVER:
+        from engines.model_host import RemoteWhisper
+        return RemoteWhisper(MODEL_SERVER)
+    print(f"Loading Whisper ({inference.whisper_id()})...")
+    return inference.load_whisper()
+
+def _load_sentence_transformer():
+    if not ST_AVAILABLE:
+        return None
+    if MODEL_SERVER:
+        from engines.model_host import RemoteEncoder
+        return RemoteEncoder(MODEL_SERVER)
+    print(f"Loading Sentence Transformer ({inference.EMBED_BACKEND})...")
+    return inference.load_embedder(ST_MODEL_NAME)
+
+def _load_keyword_index():
+    st_model = MODELS.get("sentence_transformer")
+    if st_model is None:
+        return None
+    # Backends embed slightly differently, so each gets its own cached index
+    return build_keyword_index(st_model, model_name=inference.embed_id(ST_MODEL_NAME))
+
+def _load_grammar_tool():
+    if MODEL_SERVER:
+        from engines.model_host import RemoteGrammar
+        return RemoteGrammar(MODEL_SERVER)
     print("Loading Language Tool...")
-    tool = None
-    try:
-        tool = language_tool_python.LanguageTool('en-US')
-    except Exception as e:
-        print(f"Failed to load Language Tool (Java missing?): {e}")
-        tool = None
-    
+    from engines.grammar_pool import LanguageToolPool
+    return LanguageToolPool()
+
+def _load_vader():
     print("Loading Vader...")
-    analyzer = SentimentIntensityAnalyzer()
-    
-    return whisper_model, st_model, tool, analyzer
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+# Process-wide, shared by every Streamlit session. Registration order is the
+# warm-up order: the text-only path (VADER, MiniLM, grammar) is ready first.
+MODELS = ModelRegistry()
+MODELS.register("vader", _load_vader)
+MODELS.register("sentence_transformer", _load_sentence_transformer)
+MODELS.register("keyword_index", _load_keyword_index)
+MODELS.register("grammar", _load_grammar_tool)
+MODELS.register("whisper", _load_whisper)
+
+def get_whisper():
+    return MODELS.get("whisper")
+
+def get_st_model():
+    return MODELS.get("sentence_transformer")
 
-def process_local(audio_path, text_input):
+_rubric_keyword_indexes = {}  # rubric version -> keyword index, for non-default rubrics
+_rubric_keyword_lock = threading.Lock()
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
     """
-    Processes audio/text using local ML models.
+    The MiniLM model behind an EmbeddingBatcher, so concurrent sessions'
+    encode calls run as shared batches. None when the model is unavailable.
+    """
+    global _embedder
+    st_model = get_st_model()
+    if st_model is None:
+        return None
+    with _embedder_lock:
+        if _embedder is None or _embedder.model is not st_model:
+            from engines.embedding_batcher import EmbeddingBatcher
+            _embedder = EmbeddingBatcher(st_model)
+        return _embedder
+
+def get_keyword_index(plan=None):
+    if plan is None or plan.version == DEFAULT_PLAN.version:
+        return MODELS.get("keyword_index")
+    st_model = get_st_model()
+    if st_model is None:
+        return None
+    with _rubric_keyword_lock:
+        if plan.version not in _rubric_keyword_indexes:
+            _rubric_keyword_indexes[plan.version] = build_keyword_index(
+                st_model, model_name=inference.embed_id(ST_MODEL_NAME), plan=plan
+            )
+        return _rubric_keyword_indexes[plan.version]
+
+def get_grammar_tool():
+    return MODELS.get("grammar")
+
+def get_analyzer():
+    return MODELS.get("vader")
+
+def warm_up(background=True):
+    """
+    Loads every local model ahead of the first request.
+    """
+    return MODELS.warm_up(background=background)
+
+def model_status():
+    """
+    Which local models are loaded and how long each took, see ModelRegistry.status.
+    """
+    return MODELS.status()
+
+def load_models():
+    """
+    Loads all necessary models for the local engine.
+    Prefer the get_* accessors, which only load what a request needs.
+    """
+    return get_whisper(), get_st_model(), get_keyword_index(), get_grammar_tool(), get_analyzer()
+
+def split_sentences(transcript):
+    sentences = re.split(r'[.!?]', transcript)
+    return [s.strip() for s in sentences if s.strip()]
+
+def transcribe_input(audio_path, text_input):
+    """
+    Returns (transcript, duration_minutes) for one input, or None if empty.
+    Whisper is only loaded when there is audio.
     """
-    whisper_model, st_model, tool, analyzer = load_models()
-    
-    transcript = ""
-    duration_minutes = 0
-    
     # 1. Transcription
     if audio_path:
-        # Calculate duration using ffmpeg (pydub removed due to Python 3.13 issues)
-        try:
-            cmd = [
-                "ffprobe", 
-                "-v", "error", 
-                "-show_entries", "format=duration", 
-                "-of", "default=noprint_wrappers=1:nokey=1", 
-                audio_path
-            ]
-            duration_str = subprocess.check_output(cmd).decode().strip()
-            duration_minutes = float(duration_str) / 60.0
-        except Exception as e:
-            print(f"Error calculating duration: {e}")
-            duration_minutes = 0
+        # Decode once; duration (speech only, for WPM) and Whisper input share the buffer
+        with tracing.stage("decode"):
+            audio = ingest_audio(audio_path)
+        duration_minutes = audio["speech_seconds"] / 60.0
         
         # Transcribe
-        result = whisper_model.transcribe(audio_path)
+        whisper_model = get_whisper()
+        with tracing.stage("transcribe"):
+            result = whisper_model.transcribe(audio["samples"])
         transcript = result["text"]
     elif text_input:
         transcript = text_input
@@ -81,166 +242,515 @@ def process_local(audio_path, text_input):
         word_count = len(transcript.split())
         duration_minutes = word_count / 130 if word_count > 0 else 0
     else:
-        return {"error": "No input provided."}
-        
-    words = transcript.split()
-    word_count = len(words)
-    
-    # 2. Scoring - Content & Structure
-    content_score = 0
-    content_feedback = []
-    
-    # Salutation
-    salutation_score = 0
-    lower_transcript = transcript.lower()
-    
-    # Check for excellent salutations
-    if any(s in lower_transcript for s in RUBRIC["content"]["salutation"]["excellent"]):
-        salutation_score = RUBRIC["content"]["salutation"]["points"]["excellent"]
-    elif any(s in lower_transcript for s in RUBRIC["content"]["salutation"]["normal"]):
-        salutation_score = RUBRIC["content"]["salutation"]["points"]["normal"]
-    else:
-        salutation_score = RUBRIC["content"]["salutation"]["points"]["none"]
-    
-    content_score += salutation_score
-    content_feedback.append(f"Salutation Score: {salutation_score}/5")
-    
-    # Keywords (Semantic Similarity or String Matching)
-    keywords_found = []
-    keyword_score = 0
-    
-    # Encode transcript sentences
-    sentences = re.split(r'[.!?]', transcript)
-    sentences = [s.strip() for s in sentences if s.strip()]
-    
-    if st_model and sentences:
-        sentence_embeddings = st_model.encode(sentences, convert_to_tensor=True)
-        
-        # Check Must Include
-        for kw in RUBRIC["content"]["keywords"]["must_include"]:
-            kw_embedding = st_model.encode(kw, convert_to_tensor=True)
-            # Compute cosine similarities
-            cosine_scores = util.cos_sim(kw_embedding, sentence_embeddings)
-            if any(score > 0.4 for score in cosine_scores[0]):
-                keyword_score += RUBRIC["content"]["keywords"]["points"]["must"]
-                keywords_found.append(kw)
-        
-        # Check Good to Include
-        for kw in RUBRIC["content"]["keywords"]["good_to_include"]:
-            kw_embedding = st_model.encode(kw, convert_to_tensor=True)
-            cosine_scores = util.cos_sim(kw_embedding, sentence_embeddings)
-            if any(score > 0.4 for score in cosine_scores[0]):
-                keyword_score += RUBRIC["content"]["keywords"]["points"]["good"]
-                keywords_found.append(kw)
-    else:
-        # Fallback: String Matching
-        lower_transcript = transcript.lower()
-        for kw in RUBRIC["content"]["keywords"]["must_include"]:
-            if kw.lower() in lower_transcript:
-                keyword_score += RUBRIC["content"]["keywords"]["points"]["must"]
-                keywords_found.append(kw)
+        return None
+    return transcript, duration_minutes
+
+def fallback_keywords(features, plan=DEFAULT_PLAN):
+    """
+    String-matching fallback used when Sentence Transformers is unavailable:
+    keywords that literally occur in the transcript (see utils.lexical).
+    """
+    hits = {hit["term"] for hit in features["keyword_hits"]}
+    return [(kw, pts) for kw, pts in zip(plan.keywords, plan.keyword_points.tolist()) if kw in hits]
+
+def check_grammar(tool, transcript):
+    """
+    Returns the number of grammar errors, or None if the LanguageTool pool is
+    unavailable or timed out.
+    """
+    if not tool:
+        return None
+    matches = tool.check(transcript)
+    return None if matches is None else len(matches)
+
+def score_transcript(transcript, duration_minutes, keyword_matches, errors, sentiment, features=None,
+                     plan=DEFAULT_PLAN):
+    """
+    Applies the rubric to one transcript given the model outputs for it.
+    keyword_matches: list of (keyword, points); errors: int or None (skipped);
+    sentiment: VADER polarity_scores dict; features: utils.lexical.analyze
+    output (computed here when not supplied).
+    """
+    if features is None:
+        features = analyze(transcript, get_lexicon(plan.rubric, plan.version))
+    return score_transcripts([(transcript, duration_minutes, keyword_matches, errors, sentiment, features)], plan)[0]
+
+def score_transcripts(items, plan=DEFAULT_PLAN):
+    """
+    Applies a compiled rubric to many transcripts in one vectorized pass.
+    items: (transcript, duration_minutes, keyword_matches, errors, sentiment,
+    features) tuples as for score_transcript.
+    """
+    if not items:
+        return []
+    rows = [
+        {
+            "word_count": features["word_count"],
+            "duration_minutes": duration_minutes,
+            "errors": errors,
+            "ttr": features["ttr"],
+            "filler_count": features["filler_count"],
+            "positivity": sentiment["pos"],  # VADER's share of positive words
+            "salutation": features["salutation"],
+            "keywords": [kw for kw, _ in keyword_matches]
+        }
+        for _, duration_minutes, keyword_matches, errors, sentiment, features in items
+    ]
+    scored = plan.evaluate(plan.batch(rows))
+    metrics, components = scored["metrics"], scored["components"]
+    target_low, target_high = plan.tables["speech_rate"].best_range()
+    salutation_max = as_score(plan.salutation_points.max())
+    keyword_max = as_score(plan.keyword_cap)
+
+    results = []
+    for n, (transcript, _, keyword_matches, errors, _, features) in enumerate(items):
+        keywords_found = rows[n]["keywords"]
+        content_feedback = [
+            f"Salutation Score: {as_score(components['content.salutation'][n])}/{salutation_max}",
+            f"Keyword Score: {as_score(components['content.keywords'][n])}/{keyword_max}. "
+            f"Found: {', '.join(keywords_found)}"
+        ]
+        skipped = errors is None
+        if skipped:
+            errors = 0
+            content_feedback.append("(Grammar check skipped - LanguageTool unavailable)")
+        fillers_found = {f["term"] for f in features["fillers"]}
+        results.append({
+            "overall_score": as_score(scored["overall"][n]),
+            "category_scores": {label: as_score(v[n]) for label, v in scored["category_scores"].items()},
+            "feedback": {
+                "Content": " ".join(content_feedback),
+                "Speech": f"WPM: {int(metrics['wpm'][n])}. Target: {as_score(target_low)}-{as_score(target_high)}.",
+                "Grammar": f"Errors: {errors}. TTR: {features['ttr']:.2f}.",
+                "Clarity": f"Fillers: {features['filler_count']} ({len(fillers_found)} unique).",
+                "Engagement": f"Positivity Score: {rows[n]['positivity']:.2f}."
+            },
+            "transcript": transcript,
+            "fillers_found": list(fillers_found),
+            "keywords_found": keywords_found,
+            # The rubric inputs (see utils.rubric.METRICS); errors_per_100 is
+            # None when the grammar check was skipped
+            "metrics": {
+                name: None if name == "errors_per_100" and skipped else round(float(v[n]), 4)
+                for name, v in metrics.items()
+            },
+            # Character offsets of fillers and literal keyword mentions
+            "highlights": highlight_spans(features, set(keywords_found))
+        })
+    return results
+
+def process_local(audio_path, text_input, rubric=None):
+    """
+    Processes audio/text using local ML models.
+    audio_path is a file path or an in-memory utils.ingest.AudioUpload.
+    rubric names a registered rubric (see utils.rubric); None is the default.
+    """
+    return process_local_batch([(audio_path, text_input)], rubric=rubric)[0]
+
+def process_local_batch(items, rubric=None):
+    """
+    Processes many (audio_path, text_input) items with one pass per model.
+    Sentences from every transcript share one memo lookup, then a single
+    encode call, similarity op and pooled grammar check for the unseen ones;
+    the rubric scores the whole batch at once.
+    Returns one result per item, shaped exactly like process_local.
+    """
+    plan = get_plan(rubric)
+    # result_key already includes the default rubric's version
+    model_id = LOCAL_MODEL_ID if plan is DEFAULT_PLAN else f"{LOCAL_MODEL_ID}+{plan.name}-{plan.version}"
+    results = [None] * len(items)
+    keys = [None] * len(items)
+    inputs = []  # (item index, transcript, duration_minutes)
+    with tracing.trace("local") as t:
+        t.count("items", len(items))
+        for i, (audio_path, text_input) in enumerate(items):
+            # A bad item (e.g. a missing or undecodable file) only fails itself
+            try:
+                with tracing.stage("cache_lookup"):
+                    keys[i] = result_key("local", model_id, audio_path, text_input)
+                    cached = RESULT_CACHE.get(keys[i]) if keys[i] else None
+                if keys[i] is None:
+                    results[i] = {"error": "No input provided."}
+                    continue
+                if cached is not None:
+                    t.count("cache_hits")
+                    results[i] = cached
+                    continue
+                t.count("cache_misses")
+                transcribed = transcribe_input(audio_path, text_input)
+            except Exception as e:
+                results[i] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            if transcribed is None:
+                results[i] = {"error": "No input provided."}
+            else:
+                inputs.append((i, *transcribed))
         
-        for kw in RUBRIC["content"]["keywords"]["good_to_include"]:
-            if kw.lower() in lower_transcript:
-                keyword_score += RUBRIC["content"]["keywords"]["points"]["good"]
-                keywords_found.append(kw)
+        for (i, _, _), result in zip(inputs, score_inputs(inputs, plan=plan)):
+            if is_complete(result):
+                RESULT_CACHE.set(keys[i], result)
+            results[i] = result
     
-    # Cap keyword score at 30 (though math allows 4*6 + 2*4 = 32)
-    keyword_score = min(keyword_score, 30)
-    content_score += keyword_score
-    content_feedback.append(f"Keyword Score: {keyword_score}/30. Found: {', '.join(keywords_found)}")
-    
-    # Flow (Simplified check: Salutation at start)
-    # Ideally we check order, but for now we give full points if salutation is in first 20% of text
-    flow_score = 0
-    if salutation_score > 0:
-        # Find index of salutation
-        # This is a heuristic
-        flow_score = 5
-    content_score += flow_score
-    
-    # 3. Speech Rate
-    wpm = calculate_wpm(word_count, duration_minutes)
-    speech_score = get_speech_rate_score(wpm)
-    
-    # 4. Language & Grammar
-    if tool:
-        matches = tool.check(transcript)
-        errors = len(matches)
-    else:
-        errors = 0
-        content_feedback.append("(Grammar check skipped - Java missing)")
-        
-    errors_per_100 = (errors / word_count) * 100 if word_count > 0 else 0
+    # Timings cover the whole batch; they are attached after caching so a
+    # cache hit reports its own (fast) trace rather than the original one
+    timings = t.to_dict()
+    for result in results:
+        if "error" not in result:
+            result["timings"] = timings
+    return results
+
+def is_complete(result):
+    """
+    False for a result scored without the grammar check (LanguageTool timed
+    out or was down). Those are not cached, so resubmitting retries the check.
+    """
+    return (result.get("metrics") or {}).get("errors_per_100", 0) is not None
+
+def score_inputs(inputs, grammar=True, plan=DEFAULT_PLAN):
+    """
+    Scores already-transcribed (item, transcript, duration_minutes) tuples.
+    Model work is done once per distinct sentence across the batch and
+    memoized across requests (see sentence_results), so boilerplate sentences
+    shared by many transcripts are only embedded and checked once.
+    grammar=False skips LanguageTool, which is used for cheap partial scores.
+    """
+    if not inputs:
+        return []
+    lexicon = get_lexicon(plan.rubric, plan.version)
+    with tracing.stage("lexical"):
+        features = [analyze(transcript, lexicon) for _, transcript, _ in inputs]
+        units = [sentence_units(transcript) for _, transcript, _ in inputs]
+    for f in features:
+        tracing.count("words", f["word_count"])
+        tracing.count("filler_hits", f["filler_count"])
     
-    # Formula: 1 - min(errors_per_100/10, 1) -> scaled to 10pts
-    grammar_val = 1 - min(errors_per_100 / 10, 1)
-    grammar_subscore = 10 if grammar_val > 0.9 else (grammar_val * 10) # Logic from prompt: >0.9 score = 10pts.
-    # Actually prompt says: ">0.9 score = 10pts". I'll assume linear scaling otherwise? 
-    # Or maybe it means the result of the formula is the score factor?
-    # Let's stick to: if formula > 0.9, give 10. Else give formula * 10.
+    per_sentence = sentence_features([u for item_units in units for u in item_units], grammar=grammar, plan=plan)
     
-    # Vocabulary (TTR)
-    unique_words = len(set([w.lower() for w in words]))
-    ttr = unique_words / word_count if word_count > 0 else 0
-    vocab_subscore = 0
-    if ttr > 0.9:
-        vocab_subscore = 10
-    elif ttr >= 0.7:
-        vocab_subscore = 8
+    with tracing.stage("scoring"):
+        return score_transcripts([
+            (transcript, duration_minutes, *aggregate_sentences(units[n], per_sentence, features[n], plan, grammar),
+             features[n])
+            for n, (_, transcript, duration_minutes) in enumerate(inputs)
+        ], plan)
+
+# Sentence-level model outputs
+# Transcripts are scored from per-sentence results: keyword hits from each
+# sentence's embedding, grammar errors per sentence, and VADER scores per
+# sentence weighted by length. Those results are memoized by sentence text in
+# SENTENCE_MEMO, and an edited transcript can also reuse its previous result's
+# sentences (rescore_local), so repeated or unchanged sentences are free.
+
+_SENTENCE_UNIT = re.compile(r'[^.!?]+[.!?]*')
+
+def sentence_units(transcript):
+    """
+    Sentences as written (whitespace collapsed), end punctuation kept since
+    LanguageTool needs it. Without the punctuation they are exactly
+    split_sentences' output.
+    """
+    units = (" ".join(m.group().split()) for m in _SENTENCE_UNIT.finditer(transcript))
+    return [u for u in units if u.rstrip(".!?").strip()]
+
+def _memo_key(sentence):
+    # Grammar and sentiment models are fixed; the embedding depends on the backend
+    return f"{inference.embed_id(ST_MODEL_NAME)}|{sentence}"
+
+def _pack_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+def _unpack_vector(packed):
+    return np.frombuffer(base64.b64decode(packed), dtype=np.float32)
+
+def sentence_results(sentences, grammar=True):
+    """
+    Returns {sentence: {"embedding", "grammar_errors", "sentiment", "tokens"}}
+    for the distinct sentences given, from SENTENCE_MEMO where possible.
+    Sentences missing from the memo (or missing a part whose model was
+    unavailable last time) are computed together: one encode call, one
+    pooled grammar check, VADER per sentence. The encode call is batched
+    with other sessions' by the EmbeddingBatcher. embedding is a packed float32
+    vector and grammar_errors None when not computed.
+    """
+    embedder = get_embedder()
+    tool = get_grammar_tool() if grammar else None
+    analyzer = get_analyzer()
+    with tracing.stage("memo_lookup"):
+        records = {s: SENTENCE_MEMO.get(_memo_key(s)) or {} for s in dict.fromkeys(sentences)}
+
+    to_embed = [s for s, r in records.items() if r.get("embedding") is None] if embedder else []
+    to_check = [s for s, r in records.items() if r.get("grammar_errors") is None] if tool else []
+    to_score = [s for s, r in records.items() if "sentiment" not in r]
+    changed = set(to_embed) | set(to_check) | set(to_score)
+    tracing.count("memo_hits", len(records) - len(changed))
+    tracing.count("memo_misses", len(changed))
+
+    if to_embed:
+        tracing.count("sentences_embedded", len(to_embed))
+        with tracing.stage("embed"):
+            embeddings = embedder.encode([s.rstrip(".!?").strip() for s in to_embed])
+        for s, embedding in zip(to_embed, embeddings):
+            records[s]["embedding"] = _pack_vector(embedding)
+    if to_check:
+        tracing.count("sentences_grammar_checked", len(to_check))
+        with tracing.stage("grammar"):
+            matches = tool.check_segments(to_check)
+        if matches is not None:
+            for s, found in zip(to_check, matches):
+                records[s]["grammar_errors"] = len(found)
+    if to_score:
+        with tracing.stage("sentiment"):
+            for s in to_score:
+                records[s]["sentiment"] = analyzer.polarity_scores(s)
+                records[s]["tokens"] = len(TOKEN_PATTERN.findall(s))
+    if changed:
+        SENTENCE_MEMO.set_many((_memo_key(s), records[s]) for s in changed)
+    return records
+
+def sentence_features(units, previous=None, grammar=True, plan=DEFAULT_PLAN):
+    """
+    Returns {sentence: {"keywords", "grammar_errors", "sentiment", "tokens"}}
+    for the given sentences. Complete entries in `previous` (same shape) are
+    reused as is; the rest come from sentence_results, with keyword hits for
+    all of them from one similarity op. keywords/grammar_errors are None
+    when their model is unavailable, so they are retried next time.
+    """
+    previous = previous or {}
+    st_model = get_st_model()
+    keyword_index = get_keyword_index(plan)
+    use_keywords = bool(st_model and keyword_index)
+    check = bool(grammar and get_grammar_tool())
+
+    features = {}
+    missing = []
+    for unit in dict.fromkeys(units):
+        prev = previous.get(unit)
+        if (prev and "sentiment" in prev
+                and (prev["keywords"] is not None or not use_keywords)
+                and (prev["grammar_errors"] is not None or not check)):
+            features[unit] = dict(prev)
+        else:
+            missing.append(unit)
+    tracing.count("sentences", len(features) + len(missing))
+    tracing.count("sentences_reused", len(features))
+    if not missing:
+        return features
+
+    outputs = sentence_results(missing, grammar=grammar)
+    keyword_lists = [None] * len(missing)
+    if use_keywords:
+        import torch
+        embeddings = torch.from_numpy(np.stack([_unpack_vector(outputs[u]["embedding"]) for u in missing]))
+        with tracing.stage("keyword_match"):
+            matches = match_keywords(keyword_index, embeddings.to(keyword_index["embeddings"].device),
+                                     list(range(len(missing))), len(missing))
+        keyword_lists = [[kw for kw, _ in found] for found in matches]
+    for unit, keywords in zip(missing, keyword_lists):
+        out = outputs[unit]
+        features[unit] = {
+            "keywords": keywords,
+            "grammar_errors": out.get("grammar_errors"),
+            "sentiment": out["sentiment"],
+            "tokens": out["tokens"]
+        }
+    return features
+
+def aggregate_sentences(units, per_sentence, features, plan=DEFAULT_PLAN, grammar=True):
+    """
+    Transcript-level (keyword_matches, errors, sentiment) from the
+    per-sentence features of its sentences (see sentence_features).
+    """
+    entries = [per_sentence[u] for u in units]
+
+    # Same model availability rules as the sentence pass
+    if get_st_model() and get_keyword_index(plan):
+        found = {kw for e in entries for kw in e["keywords"]}
+        keyword_matches = [
+            (kw, pts) for kw, pts in zip(plan.keywords, plan.keyword_points.tolist()) if kw in found
+        ]
     else:
-        vocab_subscore = 5 # Fallback
-        
-    grammar_score = grammar_subscore + vocab_subscore
-    
-    # 5. Clarity (Fillers)
-    fillers_found = []
-    filler_count = 0
-    for w in words:
-        w_clean = re.sub(r'[^\w\s]', '', w).lower()
-        if w_clean in RUBRIC["clarity"]["fillers"]:
-            filler_count += 1
-            fillers_found.append(w_clean)
-            
-    clarity_score = get_filler_score(filler_count, word_count)
-    
-    # 6. Engagement (Sentiment)
-    sentiment = analyzer.polarity_scores(transcript)
-    positivity = sentiment['pos'] # VADER gives pos, neg, neu, compound
-    # Prompt says: "Ratio of positive words". VADER 'pos' is exactly that ratio.
-    
-    engagement_score = 0
-    if positivity >= 0.9: # This is very high for VADER, usually compound is used. But sticking to prompt.
-        engagement_score = 15
-    elif positivity < 0.3:
-        engagement_score = 3
+        keyword_matches = fallback_keywords(features, plan)
+
+    error_counts = [e["grammar_errors"] for e in entries]
+    if not grammar or get_grammar_tool() is None or None in error_counts:
+        errors = None
     else:
-        # Interpolate or give middle score? Prompt only gave two conditions.
-        # "0.9 Positivity = 15pts", "<0.3 Positivity = 3pts".
-        # I'll assume linear or step between. Let's give 10 for in-between.
-        engagement_score = 10
-        
-    # Total
-    overall_score = content_score + speech_score + grammar_score + clarity_score + engagement_score
-    overall_score = min(overall_score, 100) # Cap at 100
-    
-    return {
-        "overall_score": overall_score,
-        "category_scores": {
-            "Content": content_score,
-            "Speech": speech_score,
-            "Grammar": grammar_score,
-            "Clarity": clarity_score,
-            "Engagement": engagement_score
-        },
-        "feedback": {
-            "Content": " ".join(content_feedback),
-            "Speech": f"WPM: {int(wpm)}. Target: 111-140.",
-            "Grammar": f"Errors: {errors}. TTR: {ttr:.2f}.",
-            "Clarity": f"Fillers: {filler_count} ({len(fillers_found)} unique).",
-            "Engagement": f"Positivity Score: {positivity:.2f}."
-        },
-        "transcript": transcript,
-        "fillers_found": list(set(fillers_found)),
-        "keywords_found": keywords_found
+        errors = sum(error_counts)
+
+    # VADER proportions of each sentence, weighted by its token count
+    total = sum(e["tokens"] for e in entries)
+    sentiment = {
+        k: (sum(e["sentiment"][k] * e["tokens"] for e in entries) / total if total else 0.0)
+        for k in ("neg", "neu", "pos", "compound")
     }
+    return keyword_matches, errors, sentiment
+
+def rescore_local(text_input, previous=None):
+    """
+    Scores text like process_local, but reuses the per-sentence work stored
+    in `previous` (an earlier rescore_local result) so re-analyzing an edited
+    transcript costs in proportion to the edit, not its length.
+    The result carries "sentence_features" for the next call. Results are
+    shared with process_local through the result cache, so resubmitting the
+    same text is a lookup.
+    """
+    with tracing.trace("local_incremental") as t:
+        with tracing.stage("cache_lookup"):
+            key = result_key("local", LOCAL_MODEL_ID, None, text_input)
+            cached = RESULT_CACHE.get(key) if key else None
+        if cached is not None:
+            t.count("cache_hits")
+            cached["timings"] = t.finish().to_dict()
+            return cached
+        t.count("cache_misses")
+        transcribed = transcribe_input(None, text_input)
+        if transcribed is None:
+            return {"error": "No input provided."}
+        transcript, duration_minutes = transcribed
+
+        with tracing.stage("lexical"):
+            features = analyze(transcript)
+            units = sentence_units(transcript)
+        t.count("words", features["word_count"])
+        t.count("filler_hits", features["filler_count"])
+        per_sentence = sentence_features(units, (previous or {}).get("sentence_features"))
+        keyword_matches, errors, sentiment = aggregate_sentences(units, per_sentence, features)
+        with tracing.stage("scoring"):
+            result = score_transcript(transcript, duration_minutes, keyword_matches, errors, sentiment, features)
+    result["sentence_features"] = per_sentence
+    if is_complete(result):
+        RESULT_CACHE.set(key, result)
+    result["timings"] = t.to_dict()
+    return result
+
+# Streaming transcription
+# Whisper runs per voice-activity segment so long recordings never sit in
+# memory whole and partial transcripts are available while decoding.
+
+_stream_worker_model = None
+
+def _init_stream_worker(backend, size, compute_type, threads):
+    global _stream_worker_model
+    inference.set_threads(threads)
+    if MODEL_SERVER:
+        from engines.model_host import RemoteWhisper
+        _stream_worker_model = RemoteWhisper(MODEL_SERVER)
+    else:
+        _stream_worker_model = inference.load_whisper(backend, size, compute_type)
+
+def _transcribe_segment(samples, start, model=None):
+    model = model or _stream_worker_model
+    result = model.transcribe(samples, word_timestamps=True)
+    words = []
+    for seg in result.get("segments", []):
+        for w in seg.get("words", []):
+            words.append({
+                "word": w["word"],
+                "start": round(start + w["start"], 2),
+                "end": round(start + w["end"], 2)
+            })
+    return result["text"].strip(), words
+
+def transcribe_stream(audio_path, workers=0, **vad_options):
+    """
+    Yields one dict per voice-activity segment, in order:
+    {"index", "start", "end", "text", "words", "transcript", "audio_seconds",
+    "speech_seconds"}. "transcript" is the text so far; "audio_seconds" is audio
+    decoded so far and "speech_seconds" the voiced part of it (used for WPM).
+    workers > 0 transcribes segments in parallel on a process pool (each worker
+    loads its own Whisper); at most 2 * workers segments are in flight.
+    """
+    decoded = [0]  # samples decoded so far
+
+    def blocks():
+        for block in stream_pcm(audio_path):
+            decoded[0] += len(block)
+            yield block
+
+    segments = vad_segments(blocks(), **vad_options)
+    texts = []
+    voiced = [0]  # samples inside speech segments so far
+
+    def event(index, start, n_samples, text, words):
+        if text:
+            texts.append(text)
+        voiced[0] += n_samples
+        return {
+            "index": index,
+            "start": round(start, 2),
+            "end": round(start + n_samples / SAMPLE_RATE, 2),
+            "text": text,
+            "words": words,
+            "transcript": " ".join(texts),
+            "audio_seconds": decoded[0] / SAMPLE_RATE,
+            "speech_seconds": voiced[0] / SAMPLE_RATE
+        }
+
+    if workers <= 0:
+        whisper_model = get_whisper()
+        for index, (start, samples) in enumerate(segments):
+            text, words = _transcribe_segment(samples, start, whisper_model)
+            yield event(index, start, len(samples), text, words)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_stream_worker,
+                             initargs=(inference.WHISPER_BACKEND, WHISPER_MODEL_NAME,
+                                       inference.WHISPER_COMPUTE,
+                                       inference.threads_per_worker(workers))) as pool:
+        in_flight = deque()
+        for index, (start, samples) in enumerate(segments):
+            in_flight.append((index, start, len(samples), pool.submit(_transcribe_segment, samples, start)))
+            while len(in_flight) >= 2 * workers:
+                index_, start_, n_, future = in_flight.popleft()
+                yield event(index_, start_, n_, *future.result())
+        while in_flight:
+            index_, start_, n_, future = in_flight.popleft()
+            yield event(index_, start_, n_, *future.result())
+
+def process_local_stream(audio_path, workers=0, partial_scores=True):
+    """
+    Streaming variant of process_local for audio input.
+    Yields {"type": "partial", "segment": <transcribe_stream event>, "result": ...}
+    after each segment (result is a grammar-free provisional score, or None when
+    partial_scores is False), then {"type": "result", "result": <process_local shape>}.
+    """
+    # The trace is activated only around work done here, never across a yield,
+    # so the caller's context is left untouched between events
+    t = tracing.Trace("local_stream")
+    with t.stage("cache_lookup"):
+        key = result_key("local", LOCAL_MODEL_ID, audio_path)
+        cached = RESULT_CACHE.get(key)
+    if cached is not None:
+        t.count("cache_hits")
+        cached["timings"] = t.finish().to_dict()
+        yield {"type": "result", "result": cached}
+        return
+    t.count("cache_misses")
+
+    last = None
+    segments = transcribe_stream(audio_path, workers=workers)
+    while True:
+        with t.stage("transcribe"):
+            segment = next(segments, None)
+        if segment is None:
+            break
+        last = segment
+        partial = None
+        if partial_scores and segment["transcript"]:
+            with tracing.activate(t), t.stage("partial_scoring"):
+                partial = score_inputs(
+                    [(0, segment["transcript"], segment["speech_seconds"] / 60.0)], grammar=False
+                )[0]
+        yield {"type": "partial", "segment": segment, "result": partial}
+
+    if last is None or not last["transcript"]:
+        t.finish()
+        yield {"type": "result", "result": {"error": "No speech detected in audio."}}
+        return
+    with tracing.activate(t):
+        result = score_inputs([(0, last["transcript"], last["speech_seconds"] / 60.0)])[0]
+    if is_complete(result):
+        RESULT_CACHE.set(key, result)
+    result["timings"] = t.finish().to_dict()
+    yield {"type": "result", "result": result}
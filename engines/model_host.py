@@ -0,0 +1,289 @@
+"""
+One copy of the local models shared by many workers.
+
+Every worker that loads the models itself holds its own Whisper, MiniLM and
+LanguageTool servers. Two ways to run the job workers (engines/jobs.py)
+without that:
+
+    python -m engines.model_host workers --workers 8
+        Loads the models once in this process, then forks the workers. They
+        share the weights copy-on-write (gc.freeze() keeps the collector from
+        dirtying those pages) and send grammar checks to the same
+        LanguageTool servers.
+
+    python -m engines.model_host serve --socket /tmp/coach-models.sock
+        Holds the models in this process and answers encode, transcribe and
+        grammar calls over a Unix socket. Processes started with
+        COACH_MODEL_SERVER=<socket path> get thin clients from the local
+        engine's loaders instead of loading anything. Concurrent encode calls
+        are batched into shared forward passes (engines/embedding_batcher.py).
+
+Run the app with COACH_WORKERS_EXTERNAL=1 so it only queues jobs for these
+workers. The server and its clients should use the same backend settings
+(COACH_WHISPER_*, COACH_EMBED_BACKEND), which name the models in cache keys.
+"""
+import argparse
+import os
+import signal
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "coach-models.sock")
+
+# What a remote grammar check returns per match: enough for counting and
+# mapping matches back to sentences, like language_tool_python's Match
+RemoteMatch = namedtuple("RemoteMatch", "offset length rule_id message")
+
+
+def _key_path(path):
+    return path + ".key"
+
+
+class ModelServer:
+    """
+    Serves the local engine's models over a Unix socket, one thread per
+    connection. Only the user who started it can connect: the socket is
+    mode 0600 and clients must know the authkey in <socket>.key.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        from engines import local_engine
+        self.path = path
+        self.engine = local_engine
+        # Whisper already uses every core it is given; run one at a time
+        self._transcribe_slot = threading.Semaphore(1)
+
+    def serve_forever(self):
+        self.engine.warm_up(background=False)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        authkey = os.urandom(32)
+        fd = os.open(_key_path(self.path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(authkey)
+        listener = Listener(self.path, family="AF_UNIX", authkey=authkey)
+        os.chmod(self.path, 0o600)
+        print(f"Model server listening on {self.path}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError) as e:
+                    print(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True,
+                                 name="model-server-conn").start()
+        finally:
+            listener.close()
+            try:
+                os.remove(_key_path(self.path))
+            except OSError:
+                pass
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ("ok", self._call(op, args))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    def _call(self, op, args):
+        if op == "ping":
+            return os.getpid()
+        if op == "info":
+            return {
+                "pid": os.getpid(),
+                "whisper": self.engine.inference.whisper_id(),
+                "embed": self.engine.inference.embed_id(self.engine.ST_MODEL_NAME),
+                "models": self.engine.model_status()
+            }
+        if op == "encode":
+            # Calls from every client connection share batches
+            return self.engine.get_embedder().encode(*args)
+        if op == "transcribe":
+            audio, kwargs = args
+            with self._transcribe_slot:
+                return self.engine.get_whisper().transcribe(audio, **kwargs)
+        if op == "grammar_check":
+            return _remote_matches(self.engine.get_grammar_tool().check(*args))
+        if op == "grammar_segments":
+            per_segment = self.engine.get_grammar_tool().check_segments(*args)
+            return None if per_segment is None else [_remote_matches(m) for m in per_segment]
+        if op == "grammar_size":
+            return self.engine.get_grammar_tool().size
+        raise ValueError(f"Unknown model server call {op!r}")
+
+
+def _remote_matches(matches):
+    if matches is None:
+        return None
+    return [RemoteMatch(m.offset, m.errorLength, m.ruleId, m.message) for m in matches]
+
+
+class ModelClient:
+    """
+    Calls a ModelServer. Each thread gets its own connection; a dropped
+    connection (e.g. the server restarted) is reopened once per call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # A forked child must not share the parent's connections
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with open(_key_path(self.path), "rb") as f:
+                authkey = f.read()
+            conn = Client(self.path, family="AF_UNIX", authkey=authkey)
+            self._local.conn = conn
+        return conn
+
+    def call(self, op, *args):
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.send((op, args))
+                status, value = conn.recv()
+                break
+            except (EOFError, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status == "error":
+            raise RuntimeError(f"Model server {op} failed: {value}")
+        return value
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(path):
+    with _clients_lock:
+        if path not in _clients:
+            _clients[path] = ModelClient(path)
+        return _clients[path]
+
+
+class RemoteEncoder:
+    """
+    Stands in for a SentenceTransformer; encode() runs on the model server.
+    """
+
+    device = "cpu"
+
+    def __init__(self, path):
+        self.client = get_client(path)
+
+    def encode(self, sentences, convert_to_tensor=False, convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        embeddings = self.client.call("encode", [sentences] if single else list(sentences))
+        if single:
+            embeddings = embeddings[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(embeddings)
+        return embeddings
+
+
+class RemoteWhisper:
+    """
+    Stands in for a Whisper model; transcribe() runs on the model server.
+    """
+
+    def __init__(self, path):
+        self.client = get_client(path)
+
+    def transcribe(self, audio, **kwargs):
+        return self.client.call("transcribe", audio, kwargs)
+
+
+class RemoteGrammar:
+    """
+    Stands in for a LanguageToolPool, checking on the server's pool.
+    Matches come back as RemoteMatch tuples.
+    """
+
+    def __init__(self, path):
+        self.client = get_client(path)
+
+    @property
+    def size(self):
+        return self.client.call("grammar_size")
+
+    def check(self, text):
+        return self.client.call("grammar_check", text)
+
+    def check_segments(self, segments):
+        return self.client.call("grammar_segments", list(segments))
+
+    def close(self):
+        pass
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+
+def run_workers(n_workers=None):
+    """
+    Loads the models, forks n_workers job workers that share them and
+    supervises them until interrupted.
+    """
+    from engines.jobs import WorkerPool
+    pool = WorkerPool(n_workers, share_models=True)
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    try:
+        pool.start(background=False)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share one copy of the local models between workers.")
+    sub = parser.add_subparsers(dest="mode", required=True)
+    workers = sub.add_parser("workers", help="Load the models once and fork job workers that share them")
+    workers.add_argument("--workers", type=int, help="Worker processes (default: COACH_WORKERS or 2)")
+    serve = sub.add_parser("serve", help="Serve the models to other processes over a Unix socket")
+    serve.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Socket path (default: {DEFAULT_SOCKET})")
+    args = parser.parse_args(argv)
+
+    # This process holds the real models, so it must not become a client itself
+    os.environ.pop("COACH_MODEL_SERVER", None)
+    if args.mode == "workers":
+        # Health-check threads stay out of the parent, which forks workers
+        # for as long as it runs; a worker replaces a server that fails it
+        os.environ.setdefault("COACH_LT_HEALTH_INTERVAL", "0")
+        run_workers(args.workers)
+    else:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        try:
+            ModelServer(args.socket).serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    Loads named models lazily on first use and keeps them for the lifetime of
+    the process. Each model has its own lock, so loading Whisper never blocks
+    a request that only needs VADER.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._status = {}
+        self._warm_up_thread = None
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """
+        loader() returns the model, or None if it is unavailable (the engine
+        then takes its fallback path). Exceptions are recorded as failures.
+        """
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._status[name] = {"state": "not_loaded", "seconds": None, "error": None}
+
+    def get(self, name):
+        if name in self._models:
+            return self._models[name]
+        with self._locks[name]:
+            if name in self._models:
+                return self._models[name]
+            self._status[name]["state"] = "loading"
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                print(f"Failed to load {name}: {e}")
+                model = None
+                self._status[name]["error"] = str(e)
+            self._status[name]["seconds"] = round(time.perf_counter() - start, 3)
+            if model is None:
+                self._status[name]["state"] = "unavailable"
+            else:
+                self._status[name]["state"] = "ready"
+            self._models[name] = model
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def status(self):
+        """
+        {name: {"state", "seconds", "error"}} where state is one of
+        not_loaded, loading, ready, unavailable.
+        """
+        return {name: dict(info) for name, info in self._status.items()}
+
+    def warm_up(self, names=None, background=True):
+        """
+        Loads the given models (all, in registration order, by default).
+        With background=True this runs once on a daemon thread and returns it.
+        """
+        names = list(names or self._loaders)
+        if not background:
+            for name in names:
+                self.get(name)
+            return None
+        with self._lock:
+            if self._warm_up_thread is None:
+                self._warm_up_thread = threading.Thread(
+                    target=self.warm_up, args=(names, False), daemon=True, name="model-warm-up"
+                )
+                self._warm_up_thread.start()
+            return self._warm_up_thread
@@ -0,0 +1,190 @@
+import os
+import subprocess
+import threading
+import numpy as np
+
+# Whisper expects 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Voice activity detection defaults
+VAD_FRAME_MS = 30
+VAD_ENERGY_THRESHOLD = 0.01   # frame RMS (~ -40 dBFS) above which a frame counts as speech
+VAD_MIN_SILENCE_MS = 600      # silence needed to close a segment
+VAD_PAD_MS = 200              # audio kept on each side of a segment
+VAD_MAX_SEGMENT_S = 30        # Whisper's window; longer speech is cut here
+
+
+def _feed_stdin(pipe, data, chunk_bytes=1 << 16):
+    try:
+        for start in range(0, len(data), chunk_bytes):
+            pipe.write(data[start:start + chunk_bytes])
+    except OSError:
+        pass  # ffmpeg stopped reading; its exit status reports why
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+def stream_pcm(audio_path, block_seconds=1.0):
+    """
+    Decodes audio with ffmpeg and yields float32 blocks of at most
+    block_seconds. Only one block is held in memory at a time.
+    audio_path may also be an in-memory utils.ingest.AudioUpload, whose
+    bytes are piped to ffmpeg's stdin.
+    """
+    if isinstance(audio_path, (str, os.PathLike)):
+        source, data = audio_path, None
+    else:
+        source, data = audio_path.ffmpeg_source()
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-v", "error",
+        "-i", source,
+        "-f", "s16le",
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        "-"
+    ]
+    block_bytes = int(SAMPLE_RATE * block_seconds) * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            stdin=subprocess.PIPE if data is not None else subprocess.DEVNULL)
+    feeder = None
+    if data is not None:
+        # Written from a thread so ffmpeg's output is drained while it reads
+        feeder = threading.Thread(target=_feed_stdin, args=(proc.stdin, data), daemon=True,
+                                  name="ffmpeg-stdin")
+        feeder.start()
+    try:
+        leftover = b""
+        while True:
+            chunk = proc.stdout.read(block_bytes)
+            if not chunk:
+                break
+            chunk = leftover + chunk
+            # keep whole int16 samples only
+            cut = len(chunk) - (len(chunk) % 2)
+            leftover = chunk[cut:]
+            if cut:
+                yield np.frombuffer(chunk[:cut], np.int16).astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+        if feeder:
+            feeder.join()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode audio: {stderr.decode(errors='ignore').strip()}")
+
+
+def frame_energies(samples, frame_ms=VAD_FRAME_MS):
+    """
+    RMS energy for each full frame of samples.
+    """
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def vad_segments(blocks,
+                 frame_ms=VAD_FRAME_MS,
+                 energy_threshold=VAD_ENERGY_THRESHOLD,
+                 min_silence_ms=VAD_MIN_SILENCE_MS,
+                 pad_ms=VAD_PAD_MS,
+                 max_segment_s=VAD_MAX_SEGMENT_S):
+    """
+    Cuts a stream of float32 blocks into voice-activity segments.
+    Yields (start_seconds, samples) as soon as each segment closes, so memory
+    stays bounded by max_segment_s plus one block regardless of input length.
+    """
+    frame_len = SAMPLE_RATE * frame_ms // 1000
+    pad = SAMPLE_RATE * pad_ms // 1000
+    silence_frames_to_close = max(1, min_silence_ms // frame_ms)
+    max_len = int(SAMPLE_RATE * max_segment_s)
+
+    pending = np.zeros(0, dtype=np.float32)   # samples not yet framed
+    history = np.zeros(0, dtype=np.float32)   # recent silence, used as leading pad
+    segment = []                              # frames of the open segment
+    segment_len = 0
+    segment_start = 0
+    silent_run = 0
+    position = 0                              # absolute sample index of `pending`
+
+    def close_segment():
+        samples = np.concatenate(segment)
+        # drop trailing silence beyond the pad
+        trailing = max(0, silent_run * frame_len - pad)
+        if trailing:
+            samples = samples[:len(samples) - trailing]
+        return segment_start / SAMPLE_RATE, samples
+
+    for block in blocks:
+        pending = np.concatenate([pending, block]) if len(pending) else block
+        n_frames = len(pending) // frame_len
+        energies = frame_energies(pending[:n_frames * frame_len], frame_ms)
+        for f in range(n_frames):
+            frame = pending[f * frame_len:(f + 1) * frame_len]
+            frame_pos = position + f * frame_len
+            is_speech = energies[f] >= energy_threshold
+            if segment:
+                segment.append(frame)
+                segment_len += frame_len
+                silent_run = 0 if is_speech else silent_run + 1
+                if silent_run >= silence_frames_to_close or segment_len >= max_len:
+                    yield close_segment()
+                    segment, segment_len, silent_run = [], 0, 0
+                    history = np.zeros(0, dtype=np.float32)
+            elif is_speech:
+                segment = [history, frame] if len(history) else [frame]
+                segment_len = len(history) + frame_len
+                segment_start = frame_pos - len(history)
+                silent_run = 0
+            else:
+                history = np.concatenate([history, frame])[-pad:] if pad else history
+        position += n_frames * frame_len
+        pending = pending[n_frames * frame_len:]
+
+    if segment:
+        if len(pending):
+            segment.append(pending)
+        yield close_segment()
+
+
+def decode_audio(audio_path):
+    """
+    Decodes the whole file once into a 16 kHz mono float32 buffer.
+    """
+    blocks = list(stream_pcm(audio_path, block_seconds=30.0))
+    if not blocks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(blocks)
+
+
+def speech_seconds(samples, **vad_options):
+    """
+    Seconds of voiced audio in samples (silence between segments excluded).
+    """
+    return sum(len(seg) for _, seg in vad_segments([samples], **vad_options)) / SAMPLE_RATE
+
+
+def ingest_audio(audio_path):
+    """
+    Single audio-ingest stage: one decode feeds duration, speech-only duration
+    and the Whisper input.
+    Returns {"samples", "duration_seconds", "speech_seconds"}.
+    """
+    samples = decode_audio(audio_path)
+    duration = len(samples) / SAMPLE_RATE
+    voiced = speech_seconds(samples)
+    return {
+        "samples": samples,
+        "duration_seconds": duration,
+        # A recording quieter than the VAD threshold is treated as all speech
+        "speech_seconds": voiced if voiced > 0 else duration
+    }
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.rubric import RUBRIC_VERSION
+
+
+class ResultCache:
+    """
+    Size-bounded in-memory LRU with an optional SQLite tier on disk.
+    Values are stored as JSON, so every get() returns a fresh copy.
+    """
+
+    def __init__(self, max_items=256, db_path=None):
+        self.max_items = max_items
+        self.db_path = db_path
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = self._connect()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+        db.commit()
+        return db
+
+    def _after_fork(self):
+        # A forked worker (see engines/model_host.py) must not share the
+        # parent's SQLite connection. The inherited one is kept referenced,
+        # never closed, so the child can't checkpoint or close it.
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._inherited_db = self._db
+            self._db = self._connect()
+
+    def get(self, key):
+        with self._lock:
+            raw = self._items.get(key)
+            if raw is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return json.loads(raw)
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        raw = json.dumps(value)
+        with self._lock:
+            self._remember(key, raw)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                    (key, raw, time.time())
+                )
+                self._db.commit()
+
+    def set_many(self, items):
+        """
+        Stores several (key, value) pairs with a single disk commit.
+        """
+        rows = [(key, json.dumps(value), time.time()) for key, value in items]
+        with self._lock:
+            for key, raw, _ in rows:
+                self._remember(key, raw)
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)", rows
+                )
+                self._db.commit()
+
+    def _remember(self, key, raw):
+        self._items[key] = raw
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._items)
+            }
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_audio(audio):
+    """
+    Content hash of an audio path or an in-memory utils.ingest.AudioUpload.
+    """
+    return hash_file(audio) if isinstance(audio, (str, os.PathLike)) else audio.digest()
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def result_key(engine, model_name, audio_path=None, text_input=None):
+    """
+    Content-addressed cache key: audio bytes (or whitespace-normalized text)
+    plus engine, model and rubric version. Returns None for empty input.
+    Audio takes precedence over text, matching how both engines pick input.
+    """
+    if audio_path:
+        content = "audio:" + hash_audio(audio_path)
+    elif text_input and normalize_text(text_input):
+        content = "text:" + hashlib.sha256(normalize_text(text_input).encode("utf-8")).hexdigest()
+    else:
+        return None
+    return f"{engine}|{model_name}|{RUBRIC_VERSION}|{content}"
+
+
+# Shared by both engines. COACH_RESULT_CACHE_DB enables the SQLite tier.
+RESULT_CACHE = ResultCache(
+    max_items=int(os.environ.get("COACH_RESULT_CACHE_SIZE", "256")),
+    db_path=os.environ.get("COACH_RESULT_CACHE_DB") or None
+)
+
+# Per-sentence model outputs (embedding, grammar, sentiment) shared by every
+# request; COACH_SENTENCE_MEMO_DB also shares them across worker processes.
+SENTENCE_MEMO = ResultCache(
+    max_items=int(os.environ.get("COACH_SENTENCE_MEMO_SIZE", "10000")),
+    db_path=os.environ.get("COACH_SENTENCE_MEMO_DB") or None
+)
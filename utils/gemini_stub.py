@@ -0,0 +1,182 @@
+"""
+A minimal local stand-in for the Gemini REST API, for tests and benchmarks.
+
+    python -m utils.gemini_stub --port 8765
+    COACH_GEMINI_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Implements the resumable Files API upload, generateContent and
+streamGenerateContent (server-sent events, the reply split into small chunks)
+with a canned result. It can add latency, pace the streamed chunks and answer
+the first N requests with 429 to exercise retries. A result given as a string
+is sent verbatim, e.g. to test malformed replies.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In the order responseSchema asks for, scores first
+DEFAULT_RESULT = {
+    "category_scores": {
+        "Content": 30,
+        "Speech": 10,
+        "Grammar": 16,
+        "Clarity": 12,
+        "Engagement": 10
+    },
+    "overall_score": 78,
+    "feedback": {
+        "Content": "Covers name, age and hobbies.",
+        "Speech": "Comfortable pace.",
+        "Grammar": "Few errors.",
+        "Clarity": "Some filler words.",
+        "Engagement": "Friendly tone."
+    },
+    "transcript": "Hello everyone, my name is Sam.",
+    "fillers_found": ["um"],
+    "keywords_found": ["name"]
+}
+
+
+class StubState:
+    def __init__(self, result=None, latency=0.0, fail_first=0, chunk_size=16, chunk_delay=0.0):
+        self.result = result or DEFAULT_RESULT
+        self.latency = latency
+        self.fail_first = fail_first
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.counts = {"upload_start": 0, "upload": 0, "generate": 0, "stream": 0, "rate_limited": 0}
+        self._ids = itertools.count(1)
+
+    def reply_text(self):
+        return self.result if isinstance(self.result, str) else json.dumps(self.result)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def should_fail(self):
+        with self.lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                self.counts["rate_limited"] += 1
+                return True
+            return False
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "GeminiStub/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, text):
+        # One SSE event per chunk; the connection closing ends the stream
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        size = max(1, self.state.chunk_size)
+        for start in range(0, len(text), size):
+            last = start + size >= len(text)
+            candidate = {"content": {"role": "model", "parts": [{"text": text[start:start + size]}]}}
+            if last:
+                candidate["finishReason"] = "STOP"
+            self.wfile.write(b"data: " + json.dumps({"candidates": [candidate]}).encode("utf-8") + b"\r\n\r\n")
+            self.wfile.flush()
+            if self.state.chunk_delay and not last:
+                time.sleep(self.state.chunk_delay)
+        self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.should_fail():
+            self._send_json(429, {"error": {"code": 429, "message": "Resource exhausted"}},
+                            {"Retry-After": "0"})
+            return
+
+        path = self.path.split("?")[0]
+        command = (self.headers.get("X-Goog-Upload-Command") or "").lower()
+        if path.startswith("/upload/v1beta/files") and command == "start":
+            self.state.count("upload_start")
+            upload_id = self.state.next_id()
+            host, port = self.server.server_address[:2]
+            self._send_json(200, {}, {
+                "X-Goog-Upload-URL": f"http://{host}:{port}/upload/v1beta/files?upload_id={upload_id}"
+            })
+        elif path.startswith("/upload/v1beta/files"):
+            self.state.count("upload")
+            file_id = self.state.next_id()
+            self._send_json(200, {"file": {
+                "name": f"files/stub-{file_id}",
+                "uri": f"http://stub/files/stub-{file_id}",
+                "mimeType": self.headers.get("Content-Type", "audio/mpeg"),
+                "state": "ACTIVE"
+            }})
+        elif path.endswith(":generateContent"):
+            self.state.count("generate")
+            self._send_json(200, {"candidates": [{
+                "content": {"role": "model", "parts": [{"text": self.state.reply_text()}]},
+                "finishReason": "STOP"
+            }]})
+        elif path.endswith(":streamGenerateContent"):
+            self.state.count("stream")
+            self._send_stream(self.state.reply_text())
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+
+
+def start_stub_server(port=0, result=None, latency=0.0, fail_first=0, chunk_size=16, chunk_delay=0.0):
+    """
+    Starts the stub on a background thread.
+    Returns (server, base_url); server.state.counts records calls and
+    server.shutdown() stops it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(result=result, latency=latency, fail_first=fail_first,
+                             chunk_size=chunk_size, chunk_delay=chunk_delay)
+    threading.Thread(target=server.serve_forever, daemon=True, name="gemini-stub").start()
+    host, bound_port = server.server_address[:2]
+    return server, f"http://{host}:{bound_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Gemini API stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with 429")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, latency=args.latency, fail_first=args.fail_first,
+                                    chunk_size=args.chunk_size, chunk_delay=args.chunk_delay)
+    print(f"Gemini stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
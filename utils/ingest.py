@@ -0,0 +1,141 @@
+"""
+In-memory ingest for uploaded audio.
+
+An AudioUpload wraps an upload as a memoryview over the uploader's own
+buffer (e.g. Streamlit's UploadedFile.getbuffer()), so the bytes are never
+copied: ffmpeg reads them over stdin, the cache key hashes them in place and
+the cloud engine sends them as the request body. Both engines accept an
+AudioUpload wherever they take an audio path.
+
+An upload is spilled to a file in COACH_INGEST_SPILL_DIR (tmpfs /dev/shm
+when available) instead when it is larger than COACH_INGEST_SPILL_MB, or when
+its container usually needs seeking to decode (MP4/M4A/MOV keep their index
+at the end, which ffmpeg can't reach on a pipe). Spilled files are removed by
+close(), or when the upload is garbage collected after an exception.
+"""
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+import weakref
+
+from utils.cache import hash_file
+
+SPILL_THRESHOLD = int(float(os.environ.get("COACH_INGEST_SPILL_MB", "64")) * 2 ** 20)
+SEEKABLE_SUFFIXES = (".mp4", ".m4a", ".mov", ".3gp")
+
+
+def _default_spill_dir():
+    shm = "/dev/shm"
+    return shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else tempfile.gettempdir()
+
+
+SPILL_DIR = os.environ.get("COACH_INGEST_SPILL_DIR") or _default_spill_dir()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AudioUpload:
+    """
+    Uploaded audio held in memory. name is the original file name (its
+    extension picks the MIME type). Use as a context manager, or call close().
+    """
+
+    def __init__(self, data, name="upload", spill_threshold=SPILL_THRESHOLD, spill_dir=SPILL_DIR):
+        view = memoryview(data)
+        self.view = view if view.format == "B" and view.ndim == 1 else view.cast("B")
+        self.name = name
+        self._size = len(self.view)
+        self.spill_dir = spill_dir
+        self.path = None
+        self._finalizer = None
+        self._digest = None
+        if len(self.view) > spill_threshold or name.lower().endswith(SEEKABLE_SUFFIXES):
+            self._spill()
+
+    def _spill(self):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(self.name)[1], dir=self.spill_dir)
+        self._finalizer = weakref.finalize(self, _remove, path)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.view)
+        self.path = path
+        # The file is the copy now; don't keep the uploader's buffer pinned
+        self.view.release()
+        self.view = None
+
+    def __len__(self):
+        return self._size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def digest(self):
+        """
+        SHA-256 of the audio bytes, computed once.
+        """
+        if self._digest is None:
+            self._digest = hash_file(self.path) if self.path else hashlib.sha256(self.view).hexdigest()
+        return self._digest
+
+    def ffmpeg_source(self):
+        """
+        (ffmpeg -i argument, bytes to write to its stdin or None).
+        """
+        if self.path:
+            return self.path, None
+        return "pipe:0", self.view
+
+    def save(self):
+        """
+        Hands the audio over as a file the caller owns and must delete (e.g.
+        for another process to score). The upload is closed.
+        """
+        if self.path is None:
+            self._spill()
+        path, self.path = self.path, None
+        self._finalizer.detach()
+        self._size = 0
+        return path
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        self.path = None
+        self._size = 0
+
+
+def audio_name(audio):
+    """
+    File name of an audio path or AudioUpload.
+    """
+    return os.path.basename(audio) if isinstance(audio, (str, os.PathLike)) else audio.name
+
+
+@contextlib.contextmanager
+def open_audio_bytes(audio):
+    """
+    The audio bytes without reading them into a new bytes object: the
+    upload's memoryview, or the file memory-mapped read-only.
+    """
+    if not isinstance(audio, (str, os.PathLike)) and audio.view is not None:
+        yield audio.view
+        return
+    path = audio if isinstance(audio, (str, os.PathLike)) else audio.path
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
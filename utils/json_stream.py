@@ -0,0 +1,144 @@
+"""
+Incremental JSON parsing for streamed model replies.
+
+    parser = JSONStreamParser()
+    for piece in chunks:
+        for path, value in parser.feed(piece):
+            ...   # ("category_scores", "Content"), 30
+
+Each value is reported as soon as its last character arrives, with its path
+from the root; objects and arrays are reported when they close. Text before
+the first "{" or "[" and after the document ends (e.g. markdown fences) is
+ignored. If the stream stops early, partial() still holds every value that
+was completed.
+"""
+import json
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_CHARS = set("0123456789+-.eEtruefalsn")
+_UNSET = object()
+
+
+class JSONStreamParser:
+    def __init__(self):
+        self._root = _UNSET
+        self._stack = []  # open containers: [container, path, pending key]
+        self._expect_key = False
+        self._string = None  # chars of the string being read, or None
+        self._escape = False
+        self._scalar = None  # chars of the number/literal being read, or None
+        self.done = False
+
+    def feed(self, text):
+        """
+        Consumes the next piece of the document and returns the (path, value)
+        pairs it completed. Raises ValueError on malformed JSON.
+        """
+        events = []
+        for ch in text:
+            if self.done:
+                break
+            if self._string is not None:
+                self._string_char(ch, events)
+            elif self._scalar is not None and ch in _SCALAR_CHARS:
+                self._scalar.append(ch)
+            else:
+                if self._scalar is not None:
+                    self._end_scalar(events)
+                self._structural(ch, events)
+        return events
+
+    def close(self):
+        """
+        Ends the stream and returns the document. Raises ValueError if it
+        is incomplete.
+        """
+        if not self.done:
+            raise ValueError("JSON document is incomplete")
+        return self._root
+
+    def partial(self):
+        """
+        The document so far, holding only completed values (None before it starts).
+        """
+        return None if self._root is _UNSET else self._root
+
+    def _string_char(self, ch, events):
+        if self._escape:
+            self._escape = False
+            self._string.append(ch)
+        elif ch == "\\":
+            self._escape = True
+            self._string.append(ch)
+        elif ch == '"':
+            value = json.loads('"' + "".join(self._string) + '"')
+            self._string = None
+            if self._expect_key:
+                self._stack[-1][2] = value
+                self._expect_key = False
+            else:
+                self._value(value, events)
+        else:
+            self._string.append(ch)
+
+    def _end_scalar(self, events):
+        token = "".join(self._scalar)
+        self._scalar = None
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON value {token!r}")
+        self._value(value, events)
+
+    def _structural(self, ch, events):
+        if ch in _WHITESPACE:
+            return
+        if self._root is _UNSET and not self._stack and ch not in "{[":
+            return  # preamble such as a ```json fence
+        top = self._stack[-1] if self._stack else None
+        if ch == '"':
+            self._string = []
+        elif ch in "{[":
+            container = {} if ch == "{" else []
+            path = self._attach(container)
+            self._stack.append([container, path, None])
+            self._expect_key = ch == "{"
+        elif ch in "}]":
+            if top is None or isinstance(top[0], dict) != (ch == "}"):
+                raise ValueError(f"Unexpected {ch!r}")
+            self._stack.pop()
+            self._expect_key = False
+            events.append((top[1], top[0]))
+            if not self._stack:
+                self.done = True
+        elif ch == ",":
+            if top is None:
+                raise ValueError("Unexpected ','")
+            self._expect_key = isinstance(top[0], dict)
+        elif ch == ":":
+            if top is None or not isinstance(top[0], dict) or top[2] is None:
+                raise ValueError("Unexpected ':'")
+        elif ch in _SCALAR_CHARS:
+            self._scalar = [ch]
+        else:
+            raise ValueError(f"Unexpected {ch!r}")
+
+    def _attach(self, value):
+        # Places a value in its parent (or as the root) and returns its path
+        if not self._stack:
+            self._root = value
+            return ()
+        container, path, key = self._stack[-1]
+        if isinstance(container, dict):
+            if key is None:
+                raise ValueError("Object value without a key")
+            container[key] = value
+            self._stack[-1][2] = None
+            return path + (key,)
+        container.append(value)
+        return path + (len(container) - 1,)
+
+    def _value(self, value, events):
+        events.append((self._attach(value), value))
+        if not self._stack:
+            self.done = True
@@ -0,0 +1,103 @@
+import re
+from utils.rubric import RUBRIC, RUBRIC_VERSION
+
+# Words are runs of letters/digits, keeping apostrophe contractions together
+TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+_END = object()  # marks a complete phrase in the trie
+_SALUTATION_RANK = {"excellent": 2, "normal": 1}
+_lexicons = {}
+
+
+def build_lexicon(rubric=RUBRIC):
+    """
+    Compiles every rubric phrase (fillers, salutations, keywords) into one
+    token trie, so a single scan over the tokens finds all of them, including
+    multi-word phrases such as "you know" or "hello everyone".
+    """
+    trie = {}
+
+    def add(phrase, kind, label):
+        node = trie
+        for token in TOKEN_PATTERN.findall(phrase.lower()):
+            node = node.setdefault(token, {})
+        node.setdefault(_END, []).append((kind, label))
+
+    for filler in rubric["clarity"]["fillers"]:
+        add(filler, "filler", filler)
+    for tier in ("excellent", "normal"):
+        for salutation in rubric["content"]["salutation"][tier]:
+            add(salutation, "salutation", tier)
+    keywords = rubric["content"]["keywords"]
+    for kw in list(keywords["must_include"]) + list(keywords["good_to_include"]):
+        add(kw, "keyword", kw)
+    return trie
+
+
+def get_lexicon(rubric=RUBRIC, version=RUBRIC_VERSION):
+    if version not in _lexicons:
+        _lexicons[version] = build_lexicon(rubric)
+    return _lexicons[version]
+
+
+def analyze(text, lexicon=None):
+    """
+    Tokenizes text once and returns every lexical feature in a single pass:
+
+    word_count, unique_words, ttr
+    fillers:      [{"term", "start", "end"}] character offsets into text
+    filler_count
+    salutation:   {"tier", "term", "start", "end", "word_index", "position"}
+                  for the best tier found (excellent > normal), or None
+    keyword_hits: [{"term", "start", "end"}] literal keyword occurrences
+    """
+    lexicon = lexicon or get_lexicon()
+    tokens = [(m.group(0).lower(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+    n = len(tokens)
+
+    unique = set()
+    fillers = []
+    keyword_hits = []
+    salutation = None
+
+    for i in range(n):
+        unique.add(tokens[i][0])
+        node = lexicon
+        j = i
+        while j < n:
+            node = node.get(tokens[j][0])
+            if node is None:
+                break
+            j += 1
+            for kind, label in node.get(_END, ()):
+                span = {"term": label, "start": tokens[i][1], "end": tokens[j - 1][2]}
+                if kind == "filler":
+                    fillers.append(span)
+                elif kind == "keyword":
+                    keyword_hits.append(span)
+                elif salutation is None or _SALUTATION_RANK[label] > _SALUTATION_RANK[salutation["tier"]]:
+                    salutation = dict(span, tier=label, term=text[span["start"]:span["end"]],
+                                      word_index=i, position=i / n)
+
+    return {
+        "word_count": n,
+        "unique_words": len(unique),
+        "ttr": len(unique) / n if n else 0,
+        "fillers": fillers,
+        "filler_count": len(fillers),
+        "salutation": salutation,
+        "keyword_hits": keyword_hits
+    }
+
+
+def highlight_spans(features, keywords=None):
+    """
+    Spans for the transcript highlighter: every filler, plus the literal
+    occurrences of `keywords` (all keyword hits when None).
+    """
+    spans = [{"start": f["start"], "end": f["end"], "kind": "filler"} for f in features["fillers"]]
+    for hit in features["keyword_hits"]:
+        if keywords is None or hit["term"] in keywords:
+            spans.append({"start": hit["start"], "end": hit["end"], "kind": "keyword"})
+    spans.sort(key=lambda s: (s["start"], s["end"]))
+    return spans
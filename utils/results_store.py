@@ -0,0 +1,410 @@
+"""
+Longitudinal results store for student progress and cohort analytics.
+
+Every scored result is appended as one row: who (student), when, which
+engine and rubric version, the overall and category scores, the rubric
+metrics (WPM, filler and grammar error counts, ...) and the timings. Rows are
+staged in SQLite first, so an append is one small durable write from any
+process. Once a day has COACH_RESULTS_FLUSH_ROWS staged rows, or the day is
+over, they are written out as a Parquet part sorted by student:
+
+    <COACH_RESULTS_DIR>/date=2026-10-17/part-<id>.parquet
+    <COACH_RESULTS_DIR>/index.db    staged rows, the parts, and which
+                                    students and rubric versions each holds
+
+Parts are never rewritten. Queries look up the parts that hold the students
+and rubric versions asked for, read only the columns they need and aggregate
+with pyarrow.compute, so no row becomes a Python object.
+
+    store = get_results_store()
+    store.append(result, student="s-17", engine="local")
+    store.percentiles("overall_score", rubric_version=RUBRIC_VERSION)
+    store.trend("overall_score", student="s-17", period="week")
+    store.cohort_averages(["overall_score", "wpm"], by="student")
+
+Requires pyarrow. Without it, appends are still staged and are written out
+once pyarrow is available.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from utils.rubric import DEFAULT_PLAN, RUBRIC_VERSION
+
+RESULTS_DIR = os.environ.get("COACH_RESULTS_DIR", "")
+FLUSH_ROWS = int(os.environ.get("COACH_RESULTS_FLUSH_ROWS", "1000"))
+
+# Metric columns, from the local engine's "metrics" (cloud results leave them null)
+METRIC_COLUMNS = ("wpm", "errors_per_100", "ttr", "filler_pct", "positivity")
+COUNT_COLUMNS = ("word_count", "filler_count", "error_count")
+PERIODS = ("day", "week", "month")
+
+
+def score_column(label):
+    return "score_" + label.lower()
+
+
+SCORE_COLUMNS = tuple(score_column(label) for label in DEFAULT_PLAN.labels)
+
+
+def result_row(result, student="", engine="", rubric_version=RUBRIC_VERSION, recorded_at=None):
+    """
+    The store row for a result, as plain JSON-able values.
+    """
+    recorded_at = recorded_at or datetime.datetime.now(datetime.timezone.utc)
+    metrics = result.get("metrics") or {}
+    row = {
+        "session_id": uuid.uuid4().hex,
+        "recorded_at": int(recorded_at.timestamp() * 1000),
+        "student": student or "",
+        "rubric_version": rubric_version,
+        "engine": engine or "",
+        "overall_score": result.get("overall_score"),
+    }
+    for label, score in (result.get("category_scores") or {}).items():
+        row[score_column(label)] = score
+    for name in METRIC_COLUMNS:
+        row[name] = metrics.get(name)
+    word_count = metrics.get("word_count")
+    row["word_count"] = None if word_count is None else int(word_count)
+    for name, pct in (("filler_count", metrics.get("filler_pct")), ("error_count", metrics.get("errors_per_100"))):
+        row[name] = None if word_count is None or pct is None else int(round(pct * word_count / 100))
+    timings = result.get("timings") or {}
+    row["total_ms"] = timings.get("total_ms")
+    row["stages_ms"] = timings.get("stages_ms") or {}
+    return row
+
+
+def _schema(score_columns):
+    import pyarrow as pa
+    return pa.schema(
+        [("session_id", pa.string()),
+         ("recorded_at", pa.timestamp("ms", tz="UTC")),
+         ("student", pa.string()),
+         ("rubric_version", pa.string()),
+         ("engine", pa.string()),
+         ("overall_score", pa.float64())]
+        + [(name, pa.float64()) for name in score_columns]
+        + [(name, pa.float64()) for name in METRIC_COLUMNS]
+        + [(name, pa.int64()) for name in COUNT_COLUMNS]
+        + [("total_ms", pa.float64()),
+           ("stages_ms", pa.map_(pa.string(), pa.float64()))]
+    )
+
+
+def _score_columns(rows):
+    extra = {name for row in rows for name in row if name.startswith("score_") and name not in SCORE_COLUMNS}
+    return SCORE_COLUMNS + tuple(sorted(extra))
+
+
+def _rows_table(rows, score_columns):
+    import pyarrow as pa
+    schema = _schema(score_columns)
+    columns = {name: [row.get(name) for row in rows] for name in schema.names}
+    columns["stages_ms"] = [list(row.get("stages_ms", {}).items()) for row in rows]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def _day(row):
+    return datetime.datetime.fromtimestamp(row["recorded_at"] / 1000, datetime.timezone.utc).date().isoformat()
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+class ResultsStore:
+    """
+    Append-only store of scored results under root (see module doc). Safe
+    to share between threads and processes.
+    """
+
+    def __init__(self, root, flush_rows=FLUSH_ROWS):
+        self.root = root
+        self.flush_rows = flush_rows
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "index.db")
+        self._lock = threading.Lock()
+        self._db = self._connect()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS staged (id INTEGER PRIMARY KEY, day TEXT, row TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS staged_day ON staged (day)")
+        db.execute("CREATE TABLE IF NOT EXISTS parts (path TEXT PRIMARY KEY, day TEXT, rows INTEGER, "
+                   "score_columns TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS part_keys (path TEXT, student TEXT, rubric_version TEXT, rows INTEGER)")
+        db.execute("CREATE INDEX IF NOT EXISTS part_keys_student ON part_keys (student)")
+        db.execute("CREATE INDEX IF NOT EXISTS part_keys_rubric ON part_keys (rubric_version)")
+        return db
+
+    def _after_fork(self):
+        # Same as ResultCache: a forked worker opens its own connection
+        self._lock = threading.Lock()
+        self._inherited_db = self._db
+        self._db = self._connect()
+
+    def append(self, result, student="", engine="", rubric_version=RUBRIC_VERSION, recorded_at=None):
+        """
+        Records a scored result and returns its session id. Error results
+        are not recorded (returns None).
+        """
+        return self.append_many([dict(result=result, student=student, engine=engine,
+                                      rubric_version=rubric_version, recorded_at=recorded_at)])[0]
+
+    def append_many(self, records):
+        """
+        Records many results in one transaction. records are dicts of
+        append()'s arguments. Returns their session ids.
+        """
+        ids, staged = [], []
+        for record in records:
+            if "error" in record["result"]:
+                ids.append(None)
+                continue
+            row = result_row(**record)
+            ids.append(row["session_id"])
+            staged.append((_day(row), json.dumps(row)))
+        if staged:
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.executemany("INSERT INTO staged (day, row) VALUES (?, ?)", staged)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            self.flush(force=False)
+        return ids
+
+    def flush(self, force=True):
+        """
+        Writes staged rows out as Parquet parts: every day's rows when force,
+        else only days that are over or have flush_rows rows staged. Returns
+        the number of rows written.
+        """
+        today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        with self._lock:
+            days = self._db.execute("SELECT day, COUNT(*) FROM staged GROUP BY day").fetchall()
+        due = [day for day, n in days if force or day < today or n >= self.flush_rows]
+        if not due:
+            return 0
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("pyarrow is not installed; results stay staged in the index until it is.")
+            return 0
+        return sum(self._flush_day(day) for day in due)
+
+    def _flush_day(self, day):
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        with self._lock:
+            # Holding the write lock keeps other processes from writing out the same rows
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                staged = self._db.execute("SELECT id, row FROM staged WHERE day = ? ORDER BY id", (day,)).fetchall()
+                if not staged:
+                    self._db.execute("ROLLBACK")
+                    return 0
+                rows = [json.loads(row) for _, row in staged]
+                score_columns = _score_columns(rows)
+                table = _rows_table(rows, score_columns)
+                table = table.take(pc.sort_indices(table, [("student", "ascending"), ("recorded_at", "ascending")]))
+                directory = os.path.join(self.root, f"date={day}")
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+                pq.write_table(table, path + ".tmp", row_group_size=max(self.flush_rows, 1))
+                # A part only counts once the index lists it, so a crash
+                # before the commit leaves an unlisted file and the rows staged
+                os.replace(path + ".tmp", path)
+                keys = table.group_by(["student", "rubric_version"]).aggregate([("session_id", "count")])
+                rel = os.path.relpath(path, self.root)
+                self._db.execute("INSERT INTO parts (path, day, rows, score_columns) VALUES (?, ?, ?, ?)",
+                                 (rel, day, len(rows), json.dumps(score_columns)))
+                self._db.executemany(
+                    "INSERT INTO part_keys (path, student, rubric_version, rows) VALUES (?, ?, ?, ?)",
+                    [(rel, s, v, n) for s, v, n in zip(keys["student"].to_pylist(),
+                                                      keys["rubric_version"].to_pylist(),
+                                                      keys["session_id_count"].to_pylist())]
+                )
+                self._db.executemany("DELETE FROM staged WHERE id = ?", [(i,) for i, _ in staged])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _snapshot(self, students, rubric_versions, since, until):
+        # The matching parts and staged rows, read in one transaction so a
+        # concurrent flush can't make rows appear twice or not at all
+        where, args = ["1"], []
+        if students is not None:
+            where.append(f"k.student IN ({','.join('?' * len(students))})")
+            args += students
+        if rubric_versions is not None:
+            where.append(f"k.rubric_version IN ({','.join('?' * len(rubric_versions))})")
+            args += rubric_versions
+        day_where, day_args = [], []
+        if since is not None:
+            day_where.append("day >= ?")
+            day_args.append(since.isoformat()[:10])
+        if until is not None:
+            day_where.append("day <= ?")
+            day_args.append(until.isoformat()[:10])
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                parts = self._db.execute(
+                    "SELECT DISTINCT p.path, p.score_columns FROM part_keys k JOIN parts p ON p.path = k.path "
+                    f"WHERE {' AND '.join(where + ['p.' + w for w in day_where])} ORDER BY p.path",
+                    args + day_args
+                ).fetchall()
+                staged = self._db.execute(
+                    f"SELECT row FROM staged WHERE {' AND '.join(['1'] + day_where)}", day_args
+                ).fetchall()
+            finally:
+                self._db.execute("COMMIT")
+        return parts, [json.loads(row) for row, in staged]
+
+    def scan(self, columns=None, student=None, rubric_version=None, engine=None, since=None, until=None):
+        """
+        The matching rows as a pyarrow Table. student, rubric_version and
+        engine take one value or a list (e.g. a cohort of students); since
+        and until are dates or datetimes (inclusive). columns defaults to all.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        students, versions, engines = _as_list(student), _as_list(rubric_version), _as_list(engine)
+        parts, staged = self._snapshot(students, versions, since, until)
+        score_columns = list(SCORE_COLUMNS)
+        for _, names in parts:
+            score_columns += [n for n in json.loads(names) if n not in score_columns]
+        score_columns += [n for n in _score_columns(staged) if n not in score_columns]
+        schema = _schema(score_columns)
+        columns = list(columns) if columns else schema.names
+
+        condition = None
+        for name, values in (("student", students), ("rubric_version", versions), ("engine", engines)):
+            if values is not None:
+                condition = _and(condition, pc.field(name).isin(values))
+        ts_type = schema.field("recorded_at").type
+        if since is not None:
+            condition = _and(condition, pc.field("recorded_at") >= pa.scalar(_as_datetime(since), ts_type))
+        if until is not None:
+            # until is inclusive: a bare date covers that whole day
+            if isinstance(until, datetime.datetime):
+                condition = _and(condition, pc.field("recorded_at") <= pa.scalar(_as_datetime(until), ts_type))
+            else:
+                end = _as_datetime(until) + datetime.timedelta(days=1)
+                condition = _and(condition, pc.field("recorded_at") < pa.scalar(end, ts_type))
+
+        tables = []
+        if parts:
+            dataset = ds.dataset([os.path.join(self.root, path) for path, _ in parts],
+                                 schema=schema, format="parquet")
+            tables.append(dataset.to_table(columns=columns, filter=condition))
+        if staged:
+            table = _rows_table(staged, score_columns)
+            if condition is not None:
+                table = table.filter(condition)
+            tables.append(table.select(columns))
+        if not tables:
+            return schema.empty_table().select(columns)
+        return pa.concat_tables(tables)
+
+    def percentiles(self, columns, q=(0.1, 0.25, 0.5, 0.75, 0.9), **filters):
+        """
+        {quantile: value} of a column over the matching rows (nulls ignored),
+        or {column: {quantile: value}} for a list of columns.
+        """
+        import pyarrow.compute as pc
+        names = [columns] if isinstance(columns, str) else list(columns)
+        table = self.scan(names, **filters)
+        out = {}
+        for name in names:
+            values = table[name]
+            if values.null_count == len(values):
+                out[name] = {p: None for p in q}
+            else:
+                out[name] = dict(zip(q, pc.quantile(values, q=list(q), interpolation="linear").to_pylist()))
+        return out[columns] if isinstance(columns, str) else out
+
+    def trend(self, column, period="week", **filters):
+        """
+        The mean and count of a column per day, week or month, oldest first,
+        as {"period": [...], "mean": [...], "count": [...]}.
+        """
+        import pyarrow.compute as pc
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        table = self.scan(["recorded_at", column], **filters)
+        starts = pc.floor_temporal(table["recorded_at"], unit=period, week_starts_monday=True)
+        grouped = (table.append_column("period", starts)
+                   .group_by("period").aggregate([(column, "mean"), (column, "count")])
+                   .sort_by("period"))
+        return {
+            "period": grouped["period"].to_pylist(),
+            "mean": grouped[f"{column}_mean"].to_pylist(),
+            "count": grouped[f"{column}_count"].to_pylist()
+        }
+
+    def cohort_averages(self, columns, by="student", **filters):
+        """
+        Per-group means of columns (and the group's session count), grouped
+        by student, rubric_version or engine, as {by: [...], "sessions": [...],
+        column: [...]}.
+        """
+        table = self.scan([by] + list(columns), **filters)
+        grouped = (table.group_by(by)
+                   .aggregate([(by, "count")] + [(name, "mean") for name in columns])
+                   .sort_by(by))
+        out = {by: grouped[by].to_pylist(), "sessions": grouped[f"{by}_count"].to_pylist()}
+        for name in columns:
+            out[name] = grouped[f"{name}_mean"].to_pylist()
+        return out
+
+    def students(self):
+        """
+        Every student with results, sorted.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT student FROM part_keys UNION SELECT json_extract(row, '$.student') FROM staged"
+            ).fetchall()
+        return sorted(s for s, in rows if s)
+
+
+def _and(condition, expr):
+    return expr if condition is None else condition & expr
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value if value.tzinfo else value.replace(tzinfo=datetime.timezone.utc)
+    return datetime.datetime(value.year, value.month, value.day, tzinfo=datetime.timezone.utc)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_results_store():
+    """
+    The store in COACH_RESULTS_DIR, or None when it is not set.
+    """
+    global _store
+    if not RESULTS_DIR:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ResultsStore(RESULTS_DIR)
+        return _store
@@ -1,51 +1,303 @@
-import re
-
-# Rubric Constants
-RUBRIC = {
-    "content": {
-        "max_score": 40,
-        "salutation": {
-            "excellent": ["hello everyone", "good morning", "good afternoon", "good evening"],
-            "normal": ["hi", "hello"],
-            "points": {"excellent": 5, "normal": 2, "none": 0}
-        },
-        "keywords": {
-            "must_include": ["name", "age", "school", "class", "family", "hobbies"],
-            "good_to_include": ["origin", "ambition", "fun fact", "strengths"],
-            "points": {"must": 4, "good": 2}
-        },
-        "flow": {
-            "order": ["salutation", "basic_details", "additional_details", "closing"],
-            "points": 5
-        }
-    },
-    "speech_rate": {
-        "max_score": 10,
-        "ideal": (111, 140),
-        "acceptable": [(81, 110), (141, 160)],
-        "points": {"ideal": 10, "acceptable": 6, "poor": 2}
-    },
-    "grammar": {
-        "max_score": 20,
-        "grammar_weight": 10,
-        "vocabulary_weight": 10
-    },
-    "clarity": {
-        "max_score": 15,
-        "fillers": ["um", "uh", "like", "you know", "so", "actually", "basically"],
-        "points": {
-            "excellent": 15, # 0-3%
-            "good": 12,      # 4-6%
-            "poor": 3        # >6% (Prompt said 13% = 3pts, assuming >6% scales down or is 3)
-            # Clarification from prompt: "13% = 3pts". I will assume > 6% is poor.
+"""
+Rubric definitions and the compiled scoring plans built from them.
+
+A rubric is a JSON document (YAML works too when PyYAML is installed);
+utils/rubrics/default.json is the built-in one. Each scored category has a
+label and max_score and either one {"metric", "table"} rule or several named
+sub-rules (grammar), plus the content category's salutation, keyword and
+flow parts. A table lists segments from the lowest value up:
+
+    {"points": 2}                          everything below the first break
+    {"from": 81, "points": 6}              81 and up
+    {"above": 110, "points": 2}            anything greater than 110
+    {"from": 1, "points": 9, "slope": -1}  9 at 1, falling by 1 per unit
+
+compile_rubric() turns a definition into a RubricPlan once: tables become
+sorted break arrays searched with np.searchsorted (a vectorized bisect),
+salutation tiers a lookup array and keywords a points vector, so scoring a
+batch of transcripts is a few array operations with no per-request parsing
+or branching. Extra rubrics are added with register_rubric() or loaded from
+the directory named by COACH_RUBRIC_DIR, and picked by name with get_plan().
+Every rubric needs a unique "name"; "default" is the built-in one.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+RUBRIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rubrics")
+DEFAULT_RUBRIC_PATH = os.path.join(RUBRIC_DIR, "default.json")
+
+# Inputs a table rule can score, computed per transcript by compute_metrics
+METRICS = ("wpm", "errors_per_100", "ttr", "filler_pct", "positivity", "word_count")
+SALUTATION_TIERS = ("none", "normal", "excellent")
+
+
+def load_rubric(path):
+    """
+    Reads a rubric definition from a .json, .yaml or .yml file.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError(f"PyYAML is needed to load {path}; install it or use JSON.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def rubric_version(rubric):
+    """
+    Short content hash of a rubric. Anything derived from it (cached keyword
+    embeddings, cached results) is keyed by this so edits invalidate it.
+    """
+    return hashlib.sha256(json.dumps(rubric, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+class Table:
+    """
+    A compiled piecewise table: segment i applies from starts[i] (or just
+    above it when exclusive[i]) up to the next segment, scoring
+    points[i] + slopes[i] * (x - starts[i]).
+    """
+
+    def __init__(self, segments, where="table"):
+        if not segments or "from" in segments[0] or "above" in segments[0]:
+            raise ValueError(f"{where}: the first segment must be an open {{\"points\": ...}} floor")
+        starts, exclusive = [-np.inf], [False]
+        for seg in segments[1:]:
+            if ("from" in seg) == ("above" in seg):
+                raise ValueError(f"{where}: every segment after the first needs exactly one of from/above")
+            starts.append(float(seg["from"] if "from" in seg else seg["above"]))
+            exclusive.append("above" in seg)
+        if any(b <= a for a, b in zip(starts, starts[1:])):
+            raise ValueError(f"{where}: breaks must be strictly increasing")
+        self.segments = segments
+        self.starts = np.array(starts)
+        self.exclusive = np.array(exclusive)
+        self.points = np.array([float(seg["points"]) for seg in segments])
+        self.slopes = np.array([float(seg.get("slope", 0)) for seg in segments])
+        self._origins = np.where(np.isfinite(self.starts), self.starts, 0.0)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=float)
+        idx = np.searchsorted(self.starts, x, side="right") - 1
+        # A value sitting exactly on an "above" break belongs to the segment below
+        idx = idx - (self.exclusive[idx] & (x == self.starts[idx]))
+        return self.points[idx] + self.slopes[idx] * (x - self._origins[idx])
+
+    def distance_to_break(self, x):
+        """
+        How far each value lies from the nearest break (inf for a flat table).
+        """
+        x = np.asarray(x, dtype=float)
+        breaks = self.starts[np.isfinite(self.starts)]
+        if not len(breaks):
+            return np.full(x.shape, np.inf)
+        return np.min(np.abs(x[..., None] - breaks), axis=-1)
+
+    def best_range(self):
+        """
+        (low, high) bounds of the first top-scoring segment, for feedback text.
+        """
+        best = int(np.argmax(self.points))
+        low = self.starts[best] if np.isfinite(self.starts[best]) else None
+        high = self.starts[best + 1] if best + 1 < len(self.starts) else None
+        return low, high
+
+
+class RubricPlan:
+    """
+    A rubric compiled for batch evaluation; see compile_rubric.
+    """
+
+    def __init__(self, rubric):
+        self.rubric = rubric
+        if not rubric.get("name"):
+            raise ValueError("Rubric has no \"name\"")
+        self.name = rubric["name"]
+        self.version = rubric_version(rubric)
+        self.categories = []  # (key, label, max_score, [(rule name, metric, Table)])
+        self.tables = {}
+        for key, spec in rubric.items():
+            if not isinstance(spec, dict) or "max_score" not in spec:
+                continue
+            rules = []
+            if "table" in spec:
+                rules.append((key, spec["metric"], Table(spec["table"], key)))
+            for sub, sub_spec in spec.items():
+                if isinstance(sub_spec, dict) and "table" in sub_spec:
+                    rules.append((f"{key}.{sub}", sub_spec["metric"], Table(sub_spec["table"], f"{key}.{sub}")))
+            for rule_name, metric, table in rules:
+                if metric not in METRICS:
+                    raise ValueError(f"{rule_name}: unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+                self.tables[rule_name] = table
+            self.categories.append((key, spec.get("label", key), float(spec["max_score"]), rules))
+        self.labels = [label for _, label, _, _ in self.categories]
+        self.max_scores = {label: as_score(max_score) for _, label, max_score, _ in self.categories}
+        self.overall_max = float(rubric.get("overall_max", sum(self.max_scores.values())))
+
+        content = rubric.get("content", {})
+        salutation = content.get("salutation")
+        self.salutation_points = np.array(
+            [float(salutation["points"].get(tier, 0)) if salutation else 0.0 for tier in SALUTATION_TIERS]
+        )
+        keywords = content.get("keywords") or {}
+        self.keywords = list(keywords.get("must_include", [])) + list(keywords.get("good_to_include", []))
+        self.keyword_points = np.array(
+            [float(keywords["points"]["must"])] * len(keywords.get("must_include", []))
+            + [float(keywords["points"]["good"])] * len(keywords.get("good_to_include", []))
+        )
+        self.keyword_cap = float(keywords.get("max_points", self.keyword_points.sum()))
+        self._keyword_pos = {kw: i for i, kw in enumerate(self.keywords)}
+        flow = content.get("flow") or {}
+        self.flow_points = float(flow.get("points", 0))
+        self.flow_window = float(flow.get("salutation_window", 0))
+
+    def batch(self, rows):
+        """
+        Packs per-transcript inputs into arrays. Each row has word_count,
+        duration_minutes, errors (None = skipped, counted as 0), ttr,
+        filler_count, positivity, salutation (utils.lexical salutation or
+        None) and keywords (matched keyword names).
+        """
+        n = len(rows)
+        hits = np.zeros((n, len(self.keywords)))
+        for i, row in enumerate(rows):
+            for kw in row["keywords"]:
+                if kw in self._keyword_pos:
+                    hits[i, self._keyword_pos[kw]] = 1.0
+        return {
+            "word_count": np.array([row["word_count"] for row in rows], dtype=float),
+            "duration_minutes": np.array([row["duration_minutes"] for row in rows], dtype=float),
+            "errors": np.array([row["errors"] or 0 for row in rows], dtype=float),
+            "ttr": np.array([row["ttr"] for row in rows], dtype=float),
+            "filler_count": np.array([row["filler_count"] for row in rows], dtype=float),
+            "positivity": np.array([row["positivity"] for row in rows], dtype=float),
+            "salutation_tier": np.array(
+                [SALUTATION_TIERS.index(row["salutation"]["tier"]) if row["salutation"] else 0 for row in rows]
+            ),
+            "salutation_position": np.array(
+                [row["salutation"]["position"] if row["salutation"] else np.inf for row in rows], dtype=float
+            ),
+            "keyword_hits": hits
         }
-    },
-    "engagement": {
-        "max_score": 15,
-        "thresholds": {"high": 0.9, "low": 0.3},
-        "points": {"high": 15, "low": 3}
+
+    def evaluate(self, batch):
+        """
+        Scores a batch (see batch()) in one pass. Returns arrays:
+        {"metrics": {...}, "components": {rule name: points},
+         "category_scores": {label: points}, "overall": points}.
+        """
+        metrics = compute_metrics(batch)
+        components = {}
+        for _, _, _, rules in self.categories:
+            for rule_name, metric, table in rules:
+                components[rule_name] = table(metrics[metric])
+        components["content.salutation"] = self.salutation_points[batch["salutation_tier"]]
+        components["content.keywords"] = np.minimum(batch["keyword_hits"] @ self.keyword_points, self.keyword_cap)
+        components["content.flow"] = np.where(
+            batch["salutation_position"] <= self.flow_window, self.flow_points, 0.0
+        )
+
+        category_scores = {}
+        for key, label, max_score, _ in self.categories:
+            total = sum(v for name, v in components.items() if name == key or name.startswith(key + "."))
+            category_scores[label] = np.minimum(total, max_score)
+        overall = np.minimum(sum(category_scores.values()), self.overall_max)
+        return {"metrics": metrics, "components": components,
+                "category_scores": category_scores, "overall": overall}
+
+    def near_breaks(self, metrics, margins):
+        """
+        {label: bool array}: whether any of the category's table rules has
+        its metric within margins[metric] of a break, where a small
+        measurement error could change the score. Metrics without a margin,
+        or missing from metrics, are never near.
+        """
+        near = {}
+        for _, label, _, rules in self.categories:
+            flags = np.zeros(len(next(iter(metrics.values()))), dtype=bool)
+            for _, metric, table in rules:
+                if metric in margins and metric in metrics:
+                    flags |= table.distance_to_break(metrics[metric]) <= margins[metric]
+            near[label] = flags
+        return near
+
+
+def compute_metrics(batch):
+    words = batch["word_count"]
+    duration = batch["duration_minutes"]
+    has_words = words > 0
+    safe_words = np.where(has_words, words, 1.0)
+    return {
+        "word_count": words,
+        "wpm": np.where(duration > 0, words / np.where(duration > 0, duration, 1.0), 0.0),
+        "errors_per_100": np.where(has_words, batch["errors"] / safe_words * 100, 0.0),
+        "ttr": batch["ttr"],
+        "filler_pct": np.where(has_words, batch["filler_count"] / safe_words * 100, 0.0),
+        "positivity": batch["positivity"]
     }
-}
+
+
+def as_score(value):
+    """
+    A score as a plain int when whole, else a float rounded to 2 places.
+    """
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def compile_rubric(rubric):
+    return RubricPlan(rubric)
+
+
+_PLANS = {}
+
+
+def register_rubric(definition):
+    """
+    Compiles a rubric (a dict or a path to a JSON/YAML file) and registers it
+    under its "name". Returns the plan. Raises ValueError when another rubric
+    already has that name: replacing "default" would leave DEFAULT_PLAN,
+    RUBRIC_VERSION and the cloud prompt on the built-in rubric.
+    """
+    rubric = load_rubric(definition) if isinstance(definition, str) else definition
+    plan = compile_rubric(rubric)
+    if plan.name in _PLANS:
+        where = f" ({definition})" if isinstance(definition, str) else ""
+        raise ValueError(f"A rubric named {plan.name!r} is already registered{where}")
+    _PLANS[plan.name] = plan
+    return plan
+
+
+def get_plan(name=None):
+    """
+    The compiled plan for a registered rubric (the default one when name is None).
+    """
+    try:
+        return _PLANS[name or "default"]
+    except KeyError:
+        raise ValueError(f"Unknown rubric {name!r}; registered: {', '.join(sorted(_PLANS))}")
+
+
+def rubric_names():
+    return sorted(_PLANS)
+
+
+RUBRIC = load_rubric(DEFAULT_RUBRIC_PATH)
+DEFAULT_PLAN = register_rubric(RUBRIC)
+RUBRIC_VERSION = DEFAULT_PLAN.version
+
+# Deployment-specific rubrics, e.g. one per course or grade level
+if os.environ.get("COACH_RUBRIC_DIR"):
+    for _path in sorted(glob.glob(os.path.join(os.environ["COACH_RUBRIC_DIR"], "*.*"))):
+        if _path.lower().endswith((".json", ".yaml", ".yml")):
+            register_rubric(_path)
+
 
 def calculate_wpm(word_count, duration_minutes):
     if duration_minutes <= 0:
@@ -53,24 +305,8 @@ def calculate_wpm(word_count, duration_minutes):
     return word_count / duration_minutes
 
 def get_speech_rate_score(wpm):
-    if RUBRIC["speech_rate"]["ideal"][0] <= wpm <= RUBRIC["speech_rate"]["ideal"][1]:
-        return RUBRIC["speech_rate"]["points"]["ideal"]
-    
-    for r in RUBRIC["speech_rate"]["acceptable"]:
-        if r[0] <= wpm <= r[1]:
-            return RUBRIC["speech_rate"]["points"]["acceptable"]
-            
-    return RUBRIC["speech_rate"]["points"]["poor"]
+    return as_score(DEFAULT_PLAN.tables["speech_rate"](wpm))
 
 def get_filler_score(filler_count, total_words):
-    if total_words == 0:
-        return RUBRIC["clarity"]["points"]["excellent"]
-    
-    percentage = (filler_count / total_words) * 100
-    
-    if percentage <= 3:
-        return RUBRIC["clarity"]["points"]["excellent"]
-    elif percentage <= 6:
-        return RUBRIC["clarity"]["points"]["good"]
-    else:
-        return RUBRIC["clarity"]["points"]["poor"]
+    percentage = (filler_count / total_words) * 100 if total_words else 0
+    return as_score(DEFAULT_PLAN.tables["clarity"](percentage))
@@ -0,0 +1,267 @@
+"""
+Lightweight per-request tracing for the scoring pipeline.
+
+    with tracing.trace("local") as t:      # one trace per request (or batch)
+        with tracing.stage("transcribe"):  # no-op when no trace is active
+            ...
+        tracing.count("words", 120)
+    result["timings"] = t.to_dict()
+
+Finished traces feed process-wide metrics, along with values recorded
+outside a trace by observe()/set_gauge() (e.g. embedding batch sizes).
+Metrics are exported as Prometheus text (prometheus_text(), or the file named
+by COACH_METRICS_FILE); traces are optionally logged as one JSON line each
+(COACH_TRACE_LOG = a file path or "stderr").
+COACH_PROFILE=<dir> additionally runs traces under cProfile and dumps a .prof
+file per trace there. Only one profiler can be active per process, so a
+trace that starts while another is being profiled (nested, or concurrent in
+another thread or task) is not profiled itself.
+"""
+import contextlib
+import contextvars
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+TRACE_LOG = os.environ.get("COACH_TRACE_LOG")
+METRICS_FILE = os.environ.get("COACH_METRICS_FILE")
+PROFILE_DIR = os.environ.get("COACH_PROFILE")
+METRICS_FILE_INTERVAL = 5.0  # seconds between rewrites of METRICS_FILE
+
+# Histogram buckets for stage latency, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = contextvars.ContextVar("coach_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.id = uuid.uuid4().hex[:12]
+        self.stages = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self.total = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        if self.total is None:
+            self.total = time.perf_counter() - self._start
+            METRICS.observe(self)
+            _log(self)
+        return self
+
+    def to_dict(self):
+        total = self.total if self.total is not None else time.perf_counter() - self._start
+        return {
+            "trace_id": self.id,
+            "total_ms": round(total * 1000, 2),
+            "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+            "counters": dict(self.counters)
+        }
+
+
+@contextlib.contextmanager
+def trace(name):
+    """
+    Starts a trace and makes it current for stage()/count() calls in this
+    context (threads and asyncio tasks started inside do not inherit it).
+    """
+    t = Trace(name)
+    token = _current.set(t)
+    profiler = _start_profiler() if PROFILE_DIR else None
+    try:
+        yield t
+    finally:
+        if profiler:
+            profiler.disable()
+            _profiling.release()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{t.id}.prof"))
+        _current.reset(token)
+        t.finish()
+
+
+_profiling = threading.Lock()
+
+
+def _start_profiler():
+    # Returns None when another trace (or another tool) is already profiling
+    if not _profiling.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profiling.release()
+        return None
+    return profiler
+
+
+@contextlib.contextmanager
+def activate(t):
+    """
+    Makes an existing trace current, e.g. inside a generator between yields.
+    """
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def stage(name):
+    t = _current.get()
+    return t.stage(name) if t is not None else contextlib.nullcontext()
+
+
+def count(name, n=1):
+    t = _current.get()
+    if t is not None:
+        t.count(name, n)
+
+
+class Metrics:
+    """
+    Process-wide aggregate of finished traces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_hist = {}   # (trace name, stage) -> [bucket counts..., count, sum]
+        self.counters = {}     # (trace name, counter) -> total
+        self.traces = {}       # trace name -> count
+        self.values = {}       # name -> (buckets, [bucket counts..., count, sum])
+        self.gauges = {}       # name -> last value
+        self._last_write = 0.0
+
+    def observe_value(self, name, value, buckets=BUCKETS):
+        with self._lock:
+            buckets, hist = self.values.setdefault(name, (buckets, [0] * (len(buckets) + 2)))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, t):
+        with self._lock:
+            self.traces[t.name] = self.traces.get(t.name, 0) + 1
+            for stage_name, seconds in list(t.stages.items()) + [("total", t.total)]:
+                hist = self.stage_hist.setdefault((t.name, stage_name), [0] * (len(BUCKETS) + 2))
+                for i, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                        hist[i] += 1
+                hist[-2] += 1
+                hist[-1] += seconds
+            for counter, n in t.counters.items():
+                key = (t.name, counter)
+                self.counters[key] = self.counters.get(key, 0) + n
+            write_file = METRICS_FILE and time.time() - self._last_write > METRICS_FILE_INTERVAL
+            if write_file:
+                self._last_write = time.time()
+        if write_file:
+            write_prometheus(METRICS_FILE)
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP coach_traces_total Scoring requests traced.",
+            "# TYPE coach_traces_total counter",
+        ]
+        with self._lock:
+            for name, n in sorted(self.traces.items()):
+                lines.append(f'coach_traces_total{{engine="{name}"}} {n}')
+            lines += [
+                "# HELP coach_stage_seconds Time spent per pipeline stage.",
+                "# TYPE coach_stage_seconds histogram",
+            ]
+            for (name, stage_name), hist in sorted(self.stage_hist.items()):
+                labels = f'engine="{name}",stage="{stage_name}"'
+                for bound, n in zip(BUCKETS, hist):
+                    lines.append(f'coach_stage_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'coach_stage_seconds_bucket{{{labels},le="+Inf"}} {hist[-2]}')
+                lines.append(f"coach_stage_seconds_count{{{labels}}} {hist[-2]}")
+                lines.append(f"coach_stage_seconds_sum{{{labels}}} {hist[-1]:.6f}")
+            lines += [
+                "# HELP coach_events_total Pipeline counters (words, sentences, filler hits, cache hits...).",
+                "# TYPE coach_events_total counter",
+            ]
+            for (name, counter), n in sorted(self.counters.items()):
+                lines.append(f'coach_events_total{{engine="{name}",counter="{counter}"}} {n}')
+            for name, (buckets, hist) in sorted(self.values.items()):
+                lines.append(f"# TYPE coach_{name} histogram")
+                for bound, n in zip(buckets, hist):
+                    lines.append(f'coach_{name}_bucket{{le="{bound}"}} {n}')
+                lines.append(f'coach_{name}_bucket{{le="+Inf"}} {hist[-2]}')
+                lines.append(f"coach_{name}_count {hist[-2]}")
+                lines.append(f"coach_{name}_sum {hist[-1]:.6f}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE coach_{name} gauge")
+                lines.append(f"coach_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def observe(name, value, buckets=BUCKETS):
+    """
+    Records a value outside any trace (e.g. a batch size) in a histogram.
+    """
+    METRICS.observe_value(name, value, buckets)
+
+
+def set_gauge(name, value):
+    METRICS.set_gauge(name, value)
+
+
+def prometheus_text():
+    return METRICS.prometheus_text()
+
+
+def write_prometheus(path):
+    """
+    Atomically writes the metrics in Prometheus text format (suitable for
+    node_exporter's textfile collector).
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+_log_lock = threading.Lock()
+
+
+def _log(t):
+    if not TRACE_LOG:
+        return
+    line = json.dumps({"event": "trace", "engine": t.name, "ts": time.time(), **t.to_dict()})
+    with _log_lock:
+        if TRACE_LOG == "stderr":
+            print(line, file=sys.stderr)
+        else:
+            with open(TRACE_LOG, "a") as f:
+                f.write(line + "\n")
@@ -1,86 +1,205 @@
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
+import bisect
+import html
+import re
+from functools import lru_cache
+from utils.rubric import get_plan
 
-def create_spider_chart(scores):
+# Charts are plain Plotly figure dicts built from fixed templates, so building
+# them needs neither pandas nor plotly.express. st.plotly_chart still turns
+# each dict into a plotly.graph_objects.Figure when it renders it; only the
+# DataFrame and px work is saved. Specs are memoized per (scores, rubric):
+# reruns of the same result reuse them. Treat returned figures as read-only.
+USER_COLOR = "#636EFA"
+IDEAL_COLOR = "#EF553B"
+CHART_MEMO_SIZE = 256
+
+SPIDER_LAYOUT = {
+    "polar": {"radialaxis": {"visible": True, "range": [0, 100], "ticksuffix": "%"}},
+    "showlegend": False
+}
+BAR_LAYOUT = {
+    "barmode": "group",
+    "xaxis": {"title": {"text": "Category"}},
+    "yaxis": {"title": {"text": "Score"}},
+    "legend": {"title": {"text": "Type"}}
+}
+
+
+def create_spider_chart(scores, rubric=None):
     """
-    Creates a spider/radar chart for the overall scores.
+    Creates a spider/radar chart for the category scores.
     scores: dict with keys 'Content', 'Speech', 'Grammar', 'Clarity', 'Engagement'
+    Each axis shows the score as a percentage of that category's maximum in
+    the rubric, so categories with different maxima are comparable.
     """
-    categories = list(scores.keys())
-    values = list(scores.values())
-    
-    fig = go.Figure()
-    fig.add_trace(go.Scatterpolar(
-        r=values,
-        theta=categories,
-        fill='toself',
-        name='User Score'
-    ))
-    
-    fig.update_layout(
-        polar=dict(
-            radialaxis=dict(
-                visible=True,
-                range=[0, 100] # Scores are 0-100 (or scaled to it)
-            )),
-        showlegend=False
-    )
-    return fig
-
-def create_bar_chart(user_scores):
+    return _spider_chart(tuple(scores.items()), rubric)
+
+
+@lru_cache(maxsize=CHART_MEMO_SIZE)
+def _spider_chart(items, rubric):
+    max_scores = get_plan(rubric).max_scores
+    categories = [c for c, _ in items]
+    maxima = [max_scores.get(c) or 100 for c in categories]
+    return {
+        "data": [{
+            "type": "scatterpolar",
+            "r": [round(v / m * 100, 1) for (_, v), m in zip(items, maxima)],
+            "theta": categories,
+            "customdata": [[v, m] for (_, v), m in zip(items, maxima)],
+            "hovertemplate": "%{theta}: %{customdata[0]} / %{customdata[1]}<extra></extra>",
+            "fill": "toself",
+            "name": "User Score"
+        }],
+        "layout": SPIDER_LAYOUT
+    }
+
+
+def create_bar_chart(user_scores, rubric=None):
     """
     Creates a grouped bar chart comparing User vs Ideal scores.
-    user_scores: dict of category scores.
-    """
-    # Ideal scores based on rubric max points
-    ideal_scores = {
-        "Content": 40,
-        "Speech": 10,
-        "Grammar": 20,
-        "Clarity": 15,
-        "Engagement": 15
+    user_scores: dict of category scores; rubric: registered rubric name.
+    """
+    return _bar_chart(tuple(user_scores.items()), rubric)
+
+
+@lru_cache(maxsize=CHART_MEMO_SIZE)
+def _bar_chart(items, rubric):
+    # Ideal scores are the rubric's category maxima
+    ideal_scores = get_plan(rubric).max_scores
+    categories = [c for c, _ in items]
+    return {
+        "data": [
+            {"type": "bar", "name": "User", "x": categories, "y": [v for _, v in items],
+             "marker": {"color": USER_COLOR}},
+            {"type": "bar", "name": "Ideal", "x": categories, "y": [ideal_scores.get(c, 0) for c in categories],
+             "marker": {"color": IDEAL_COLOR}}
+        ],
+        "layout": BAR_LAYOUT
     }
-    
-    categories = list(user_scores.keys())
-    user_vals = [user_scores[c] for c in categories]
-    ideal_vals = [ideal_scores.get(c, 0) for c in categories]
-    
-    df = pd.DataFrame({
-        "Category": categories * 2,
-        "Score": user_vals + ideal_vals,
-        "Type": ["User"] * len(categories) + ["Ideal"] * len(categories)
-    })
-    
-    fig = px.bar(df, x="Category", y="Score", color="Type", barmode="group",
-                 color_discrete_map={"User": "#636EFA", "Ideal": "#EF553B"})
-    return fig
-
-def highlight_text(text, fillers, keywords):
+
+
+TREND_LAYOUT = {
+    "xaxis": {"title": {"text": "Week"}},
+    "yaxis": {"title": {"text": "Average score"}},
+    "legend": {"title": {"text": ""}}
+}
+
+
+def create_trend_chart(student_trend, cohort_trend=None):
+    """
+    Creates a line chart of a student's average score per period, against
+    the cohort's. Trends are ResultsStore.trend() dicts.
+    """
+    def line(trend, name, color):
+        return {"type": "scatter", "mode": "lines+markers", "name": name,
+                "x": [p.isoformat() for p in trend["period"]], "y": trend["mean"],
+                "customdata": trend["count"],
+                "hovertemplate": "%{y:.1f} (%{customdata} sessions)<extra></extra>",
+                "line": {"color": color}}
+
+    data = [line(student_trend, "Student", USER_COLOR)]
+    if cohort_trend is not None:
+        data.append(line(cohort_trend, "Cohort", IDEAL_COLOR))
+    return {"data": data, "layout": TREND_LAYOUT}
+
+
+HIGHLIGHT_COLORS = {"keyword": "#90EE90", "filler": "#FFB6C1"}  # lighter green / lighter red
+# When spans overlap, the higher priority kind colors the merged span
+HIGHLIGHT_PRIORITY = {"keyword": 1, "filler": 2}
+PAGE_CHARS = 6000
+
+
+def find_spans(text, fillers, keywords):
+    """
+    Locates whole-word, case-insensitive occurrences of the given terms with a
+    single combined regex. Used when a result carries no precomputed offsets
+    (e.g. cloud results).
+    """
+    kinds = {}
+    for kw in keywords:
+        kinds[kw.lower()] = "keyword"
+    for filler in fillers:
+        kinds[filler.lower()] = "filler"
+    terms = sorted((t for t in kinds if t.strip()), key=len, reverse=True)
+    if not terms:
+        return []
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE)
+    return [
+        {"start": m.start(), "end": m.end(), "kind": kinds[m.group(0).lower()]}
+        for m in pattern.finditer(text)
+    ]
+
+
+def merge_spans(spans):
+    """
+    Sorts spans and merges overlapping ones into non-overlapping spans.
+    """
+    merged = []
+    for span in sorted(spans, key=lambda s: (s["start"], s["end"])):
+        if merged and span["start"] < merged[-1]["end"]:
+            last = merged[-1]
+            last["end"] = max(last["end"], span["end"])
+            if HIGHLIGHT_PRIORITY.get(span["kind"], 0) > HIGHLIGHT_PRIORITY.get(last["kind"], 0):
+                last["kind"] = span["kind"]
+        else:
+            merged.append(dict(span))
+    return merged
+
+
+def render_highlights(text, spans, start=0, end=None):
+    """
+    Emits escaped HTML for text[start:end] with spans wrapped in colored
+    <span>s, in one linear pass. spans must be merged (non-overlapping, sorted).
+    """
+    end = len(text) if end is None else end
+    out = []
+    pos = start
+    first = bisect.bisect_right([s["end"] for s in spans], start)
+    for span in spans[first:]:
+        if span["start"] >= end:
+            break
+        s_start, s_end = max(span["start"], start), min(span["end"], end)
+        out.append(html.escape(text[pos:s_start]))
+        color = HIGHLIGHT_COLORS.get(span["kind"], "#FFFF99")
+        out.append(
+            f'<span style="background-color: {color}; padding: 2px; border-radius: 3px;">'
+            f'{html.escape(text[s_start:s_end])}</span>'
+        )
+        pos = s_end
+    out.append(html.escape(text[pos:end]))
+    return "".join(out)
+
+
+def page_bounds(text, page_chars=PAGE_CHARS):
+    """
+    Splits text into (start, end) pages of about page_chars, cutting at whitespace.
+    """
+    bounds = []
+    start = 0
+    while start < len(text):
+        end = min(start + page_chars, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start, end)
+            if cut > start:
+                end = cut + 1
+        bounds.append((start, end))
+        start = end
+    return bounds or [(0, 0)]
+
+
+def highlight_text(text, fillers, keywords, spans=None, page=None, page_chars=PAGE_CHARS):
     """
     Returns HTML string with fillers in Red and keywords in Green.
     fillers: list of words to highlight red
     keywords: list of words to highlight green
+    spans: precomputed [{"start", "end", "kind"}] offsets (e.g. a local
+    result's "highlights"); found from fillers/keywords when omitted.
+    page: render only that page of page_bounds(text, page_chars).
     """
-    # Sort by length desc to avoid partial replacements (e.g. replacing 'cat' in 'catch')
-    # But for simple highlighting, word boundary checks are better.
-    # Using simple replacement for now, but case insensitive.
-    
-    highlighted = text
-    
-    # Helper for case-insensitive replacement with keeping original case
-    def replace_keep_case(word, text, color):
-        pattern = re.compile(re.escape(word), re.IGNORECASE)
-        return pattern.sub(lambda m: f'<span style="background-color: {color}; padding: 2px; border-radius: 3px;">{m.group(0)}</span>', text)
-
-    import re
-    
-    # Highlight keywords (Green) - lighter green for readability
-    for kw in keywords:
-        highlighted = replace_keep_case(kw, highlighted, "#90EE90")
-        
-    # Highlight fillers (Red) - lighter red
-    for filler in fillers:
-        highlighted = replace_keep_case(filler, highlighted, "#FFB6C1")
-        
-    return highlighted
+    if spans is None:
+        spans = find_spans(text, fillers, keywords)
+    spans = merge_spans(spans)
+    if page is None:
+        return render_highlights(text, spans)
+    start, end = page_bounds(text, page_chars)[page]
+    return render_highlights(text, spans, start, end)